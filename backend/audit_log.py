@@ -0,0 +1,94 @@
+"""
+Append-only JSONL audit log of sampled answers and verification decisions.
+
+Requests only enqueue records; a background thread does the file I/O, so the answer
+path never waits on disk. The queue is bounded: when the writer falls behind, records
+are dropped and counted rather than slowing requests down. The file is rotated by size
+(audit.jsonl -> audit.jsonl.1 -> ... -> audit.jsonl.N).
+"""
+import os
+import json
+import time
+import queue
+import threading
+
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", os.path.join("audit_log", "audit.jsonl"))
+AUDIT_LOG_MAX_BYTES = int(os.getenv("AUDIT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+AUDIT_LOG_BACKUPS = int(os.getenv("AUDIT_LOG_BACKUPS", "5"))
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv("AUDIT_LOG_QUEUE_SIZE", "1000"))
+
+
+class AuditLog:
+    def __init__(self, path: str = AUDIT_LOG_PATH, max_bytes: int = AUDIT_LOG_MAX_BYTES,
+                 backups: int = AUDIT_LOG_BACKUPS, queue_size: int = AUDIT_LOG_QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.counters = {"written": 0, "dropped": 0, "errors": 0, "rotations": 0}
+        self._writer = None
+        self._start_lock = threading.Lock()
+
+    def record(self, event: str, request_id: str, **fields):
+        """Queue one record. Never blocks; drops the record if the writer is backed up."""
+        self._ensure_writer()
+        entry = {"ts": round(time.time(), 3), "event": event, "request_id": request_id, **fields}
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.counters["dropped"] += 1
+
+    def stats(self):
+        return {**self.counters, "queued": self._queue.qsize(), "path": self.path}
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="audit-log", daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        f = open(self.path, "a", encoding="utf-8")
+        while True:
+            entry = self._queue.get()
+            # Write whatever else is already waiting before flushing
+            batch = [entry]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                # A failed reopen (below) is retried with the next batch
+                if f.closed:
+                    f = open(self.path, "a", encoding="utf-8")
+                for item in batch:
+                    f.write(json.dumps(item, default=str) + "\n")
+                f.flush()
+                self.counters["written"] += len(batch)
+                if f.tell() >= self.max_bytes:
+                    f.close()
+                    try:
+                        self._rotate()
+                    finally:
+                        # Even if rotation failed, keep appending to the (unrotated) log
+                        f = open(self.path, "a", encoding="utf-8")
+            except Exception as e:
+                self.counters["errors"] += 1
+                print(f"Error writing audit log: {str(e)}")
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.counters["rotations"] += 1
@@ -0,0 +1,74 @@
+"""
+Offline retrieval benchmark: vector-only vs hybrid (vector + BM25) retrieval.
+
+A case is a hit when any of the top-k retrieved chunks contains one of its expected
+phrases. Runs against the current knowledge base, no LLM calls are made.
+
+Usage:
+    python benchmark_retrieval.py [--k 1] [--cases cases.json] [--tenant default]
+
+`cases.json` is a list of {"query": "...", "expect": ["phrase", ...]} objects.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from mortgage_analysis import create_vector_db, retrieve
+
+DEFAULT_CASES = [
+    {"query": "What is my interest rate?", "expect": ["interest rate"]},
+    {"query": "How much cash do I need at closing?", "expect": ["cash to close"]},
+    {"query": "What is the APR on this loan?", "expect": ["apr", "annual percentage rate"]},
+    {"query": "Do I have an escrow account?", "expect": ["escrow"]},
+    {"query": "How much is my monthly payment?", "expect": ["monthly payment"]},
+    {"query": "Is there a prepayment penalty?", "expect": ["prepayment penalty"]},
+    {"query": "Can my loan amount go up?", "expect": ["loan amount"]},
+    {"query": "What are my total closing costs?", "expect": ["closing costs"]},
+    {"query": "What happens if I pay late?", "expect": ["late payment", "late charge", "late fee"]},
+    {"query": "How long is the loan term?", "expect": ["loan term"]},
+]
+
+
+def run(kb, cases, k, mode):
+    hits = 0
+    latencies = []
+    for case in cases:
+        started = time.perf_counter()
+        results = retrieve(kb, case["query"], k=k, mode=mode)
+        latencies.append((time.perf_counter() - started) * 1000)
+        texts = [doc.page_content.lower() for doc, _ in results]
+        if any(phrase.lower() in text for text in texts for phrase in case["expect"]):
+            hits += 1
+    return {
+        "hit_rate": hits / len(cases),
+        "p50_ms": statistics.median(latencies),
+        "max_ms": max(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=1, help="chunks retrieved per query")
+    parser.add_argument("--cases", help="JSON file of benchmark cases")
+    parser.add_argument("--tenant", default="default", help="tenant whose knowledge base is searched")
+    args = parser.parse_args()
+
+    cases = DEFAULT_CASES
+    if args.cases:
+        with open(args.cases) as f:
+            cases = json.load(f)
+
+    kb = create_vector_db(args.tenant)
+    # Warm up the embedding model so the first case doesn't carry its load time
+    retrieve(kb, "warm up", k=args.k, mode="vector")
+
+    print(f"\n📏 Retrieval benchmark: {len(cases)} cases, k={args.k}")
+    print(f"{'mode':<8} {'hit rate':>9} {'p50 ms':>8} {'max ms':>8}")
+    for mode in ("vector", "hybrid"):
+        result = run(kb, cases, args.k, mode)
+        print(f"{mode:<8} {result['hit_rate']:>9.0%} {result['p50_ms']:>8.1f} {result['max_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
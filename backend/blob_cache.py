@@ -0,0 +1,110 @@
+"""
+Size-bounded, read-through disk cache for documents served from remote storage.
+
+Cached files live in their own directory (never the indexed data directories). When the
+total size passes `max_bytes`, the least recently served files are deleted. Concurrent
+misses for the same key share one fetch. Readers should open the returned path right
+away: an open file stays readable even if it is evicted meanwhile.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+PDF_CACHE_PATH = os.getenv("PDF_CACHE_PATH", "pdf_cache")
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+class BlobCache:
+    def __init__(self, fetch, directory: str = PDF_CACHE_PATH, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        """`fetch(key, dest)` writes the blob stored under `key` (a relative path) to the file `dest`."""
+        self._fetch = fetch
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> size in bytes, least recently used first
+        self._fetching = {}             # key -> lock held while that key is being fetched
+        self.size_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "bytes_served": 0}
+        self._load()
+
+    def _load(self):
+        """Index files left by a previous run, oldest access first."""
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(".part"):
+                    os.remove(path)
+                    continue
+                stats = os.stat(path)
+                found.append((stats.st_atime, os.path.relpath(path, self.directory).replace(os.sep, "/"), stats.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.size_bytes += size
+
+    def path_of(self, key: str) -> str:
+        return os.path.join(self.directory, *key.split("/"))
+
+    def get(self, key: str) -> str:
+        """Local path of the blob, fetching it on a miss. Raises whatever `fetch` raises."""
+        if self._lookup(key):
+            return self.path_of(key)
+        with self._lock:
+            fetching = self._fetching.setdefault(key, threading.Lock())
+        # Only requests for the same key wait on a fetch
+        with fetching:
+            if self._lookup(key, coalesced=True):
+                return self.path_of(key)
+            path = self.path_of(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                self._fetch(key, path)
+            except BaseException:
+                with self._lock:
+                    self._fetching.pop(key, None)
+                raise
+            with self._lock:
+                self._entries[key] = os.path.getsize(path)
+                self.size_bytes += self._entries[key]
+                self.counters["misses"] += 1
+                self._evict(keep=key)
+                self._fetching.pop(key, None)
+            return path
+
+    def _lookup(self, key, coalesced=False):
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+            self.counters["coalesced" if coalesced else "hits"] += 1
+            return True
+
+    def _evict(self, keep):
+        while self.size_bytes > self.max_bytes:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._remove(key)
+            self.counters["evictions"] += 1
+
+    def _remove(self, key):
+        self.size_bytes -= self._entries.pop(key)
+        try:
+            os.remove(self.path_of(key))
+        except FileNotFoundError:
+            pass
+
+    def discard(self, key: str):
+        """Drop the cached copy, e.g. after the blob was deleted or replaced."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def served(self, nbytes: int):
+        with self._lock:
+            self.counters["bytes_served"] += nbytes
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "files": len(self._entries), "size_bytes": self.size_bytes,
+                    "max_bytes": self.max_bytes}
@@ -0,0 +1,179 @@
+"""
+In-memory catalog of each tenant's documents, for listing endpoints.
+
+A tenant's catalog is loaded once (local files and index manifest, then the remote listing)
+on its first listing and then kept current by upload, delete, sync and index jobs, so listing
+never goes back to storage or the filesystem. The two sides load independently: if storage
+cannot be listed, local listings still work, entries' `remote` is None (unknown), and the
+remote listing is retried by the next listing that needs it. Entries are kept sorted by filename and
+pages are addressed by a cursor (the last filename returned), so a page costs a bisect
+plus the entries it scans, however many documents the tenant has.
+"""
+import bisect
+import threading
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def new_entry(filename):
+    return {
+        "filename": filename,
+        "size_bytes": None,
+        "sha256": None,
+        "local": False,            # in the tenant's data directory
+        "remote": False,           # in Supabase storage; None while storage could not be listed
+        "indexed": False,
+        "chunks": 0,
+        "uploaded_at": None,
+        "modified_at": None,
+    }
+
+
+class DocumentCatalog:
+    def __init__(self, load_local, load_remote):
+        """
+        `load_local(tenant)` returns the tenant's entries (see `new_entry`) from disk and its index;
+        `load_remote(tenant)` returns a {"filename", "size_bytes", "uploaded_at"} dict per document in storage.
+        """
+        self._load_local = load_local
+        self._load_remote = load_remote
+        self._lock = threading.Lock()
+        self._entries = {}        # tenant -> {filename: entry}
+        self._names = {}          # tenant -> sorted filenames
+        self._remote_known = {}   # tenant -> whether the storage listing has been merged in
+        self._loading = {}        # tenant -> lock held while that tenant is being loaded
+        self.counters = {"loads": 0, "remote_failures": 0, "pages": 0, "updates": 0}
+
+    def _ready(self, tenant, need_remote):
+        return tenant in self._entries and (self._remote_known[tenant] or not need_remote)
+
+    def _ensure_loaded(self, tenant, need_remote):
+        with self._lock:
+            if self._ready(tenant, need_remote):
+                return
+            loading = self._loading.setdefault(tenant, threading.Lock())
+        with loading:
+            with self._lock:
+                if self._ready(tenant, need_remote):
+                    return
+                loaded = tenant in self._entries
+            if not loaded:
+                entries = {entry["filename"]: entry for entry in self._load_local(tenant)}
+            error = None
+            try:
+                remote = self._load_remote(tenant)
+            except Exception as e:
+                print(f"Error listing stored documents for tenant '{tenant}': {str(e)}")
+                remote, error = None, e
+            with self._lock:
+                if not loaded:
+                    for entry in entries.values():
+                        entry["remote"] = None
+                    self._entries[tenant] = entries
+                    self._names[tenant] = sorted(entries)
+                    self._remote_known[tenant] = False
+                    self.counters["loads"] += 1
+                if remote is None:
+                    self.counters["remote_failures"] += 1
+                else:
+                    self._merge_remote(tenant, remote)
+                self._loading.pop(tenant, None)
+        if error is not None and need_remote:
+            raise error
+
+    def _merge_remote(self, tenant, remote):
+        entries, names = self._entries[tenant], self._names[tenant]
+        listed = set()
+        for item in remote:
+            filename = item["filename"]
+            entry = entries.get(filename)
+            if entry is None:
+                entry = entries[filename] = new_entry(filename)
+                bisect.insort(names, filename)
+            entry["remote"] = True
+            if entry["size_bytes"] is None:
+                entry["size_bytes"] = item["size_bytes"]
+            if item["uploaded_at"] is not None:
+                entry["uploaded_at"] = item["uploaded_at"]
+            listed.add(filename)
+        for filename, entry in entries.items():
+            if filename not in listed:
+                entry["remote"] = False
+        self._remote_known[tenant] = True
+
+    def page(self, tenant, cursor=None, limit=DEFAULT_PAGE_SIZE, where=lambda entry: True, need_remote=False):
+        """
+        Up to `limit` entries matching `where`, in filename order, after the filename `cursor`.
+        Returns (entries, next cursor or None when there are no more). With `need_remote`, the
+        storage listing must be known: it is retried if it failed before, and its error raised.
+        """
+        self._ensure_loaded(tenant, need_remote)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._lock:
+            entries, names = self._entries[tenant], self._names[tenant]
+            position = bisect.bisect_right(names, cursor) if cursor else 0
+            found = []
+            while position < len(names) and len(found) <= limit:
+                entry = entries[names[position]]
+                if where(entry):
+                    found.append(dict(entry))
+                position += 1
+            self.counters["pages"] += 1
+        if len(found) > limit:
+            return found[:limit], found[limit - 1]["filename"]
+        return found, None
+
+    def find(self, tenant, where):
+        """The first entry matching `where`, in filename order, or None."""
+        self._ensure_loaded(tenant, need_remote=False)
+        with self._lock:
+            entries = self._entries[tenant]
+            for filename in self._names[tenant]:
+                if where(entries[filename]):
+                    return dict(entries[filename])
+        return None
+
+    def update(self, tenant, filename, **fields):
+        """Create or update one entry. A no-op until the tenant's catalog has been loaded."""
+        with self._lock:
+            entries = self._entries.get(tenant)
+            if entries is None:
+                return
+            entry = entries.get(filename)
+            if entry is None:
+                entry = entries[filename] = new_entry(filename)
+                bisect.insort(self._names[tenant], filename)
+            entry.update(fields)
+            self.counters["updates"] += 1
+
+    def remove(self, tenant, filename):
+        with self._lock:
+            entries = self._entries.get(tenant)
+            if entries is None or entries.pop(filename, None) is None:
+                return
+            names = self._names[tenant]
+            del names[bisect.bisect_left(names, filename)]
+            self.counters["updates"] += 1
+
+    def apply_manifest(self, tenant, manifest_by_name):
+        """Refresh indexed status from `{filename: manifest entry}` after an index job."""
+        with self._lock:
+            entries = self._entries.get(tenant)
+            if entries is None:
+                return
+            for filename, entry in entries.items():
+                indexed = manifest_by_name.get(filename)
+                entry["indexed"] = indexed is not None
+                entry["chunks"] = indexed.get("chunks", 0) if indexed else 0
+                if indexed and indexed.get("sha256"):
+                    entry["sha256"] = indexed["sha256"]
+            self.counters["updates"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "tenants": {tenant: len(entries) for tenant, entries in self._entries.items()},
+                "remote_unknown": [tenant for tenant, known in self._remote_known.items() if not known],
+            }
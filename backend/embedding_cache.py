@@ -0,0 +1,87 @@
+"""
+Persistent, content-addressed embedding cache.
+
+Vectors are stored as float32 blobs in SQLite, keyed on the embedding model name and
+the SHA-256 of the chunk text, so a rebuild only pays for text it has never embedded.
+"""
+import os
+import array
+import sqlite3
+import hashlib
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from metrics import span
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying: Embeddings, model_name: str, path: str = EMBEDDING_CACHE_PATH):
+        self.underlying = underlying
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+        self.counters = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes):
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[i:i + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch],
+                )
+                for text_hash, blob in rows:
+                    vector = array.array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+        return found
+
+    def _store(self, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(self.model_name, text_hash, array.array("f", vector).tobytes()) for text_hash, vector in items],
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts):
+        hashes = [self.text_hash(text) for text in texts]
+        vectors = self._lookup(sorted(set(hashes)))
+
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+        self.counters["hits"] += len(texts) - len(missing)
+        self.counters["misses"] += len(missing)
+
+        if missing:
+            with span("embed_batch", texts=len(missing), cached=len(texts) - len(missing)):
+                computed = self.underlying.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), computed))
+            self._store(new_items)
+            vectors.update((text_hash, list(vector)) for text_hash, vector in new_items)
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text):
+        # Queries are rarely repeated verbatim and the answer cache sits in front of them anyway
+        with span("embed_query"):
+            return self.underlying.embed_query(text)
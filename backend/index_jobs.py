@@ -0,0 +1,118 @@
+"""
+In-process background indexing queue.
+
+Index requests that arrive while a job for the same tenant is still queued are folded
+into that job, so a burst of uploads triggers a single index pass instead of one per file.
+Jobs run one at a time, oldest first.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import metrics
+
+
+class IndexJobQueue:
+    def __init__(self, run_job, debounce: float = 1.0, max_history: int = 200):
+        """
+        `run_job(tenant, full)` performs one index pass and returns a dict of results (chunk counts etc).
+        `debounce` is how long a queued job waits for more requests before it starts.
+        """
+        self._run_job = run_job
+        self._debounce = debounce
+        self._max_history = max_history
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._jobs = OrderedDict()
+        self._done_events = {}
+        self._pending = OrderedDict()  # tenant -> ID of its queued job
+        self._thread = threading.Thread(target=self._worker, name="index-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, tenant: str, full: bool = False, reason: str = "") -> str:
+        """Queue an index pass for `tenant`, or join the one already waiting to run. Returns the job ID."""
+        with self._lock:
+            if tenant in self._pending:
+                job = self._jobs[self._pending[tenant]]
+                job["full"] = job["full"] or full
+                job["requests"] += 1
+                if reason:
+                    job["reasons"].append(reason)
+                return job["id"]
+
+            job_id = str(uuid.uuid4())
+            self._jobs[job_id] = {
+                "id": job_id,
+                "tenant": tenant,
+                "status": "queued",
+                "full": full,
+                "requests": 1,
+                "reasons": [reason] if reason else [],
+                "queued_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "duration_s": None,
+                "result": None,
+                "error": None,
+            }
+            self._done_events[job_id] = threading.Event()
+            self._pending[tenant] = job_id
+            self._trim_history()
+            self._wakeup.notify()
+            return job_id
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id: str, timeout: float = None):
+        """Block until the job has finished and return its final state."""
+        event = self._done_events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+        return self.get(job_id)
+
+    def _trim_history(self):
+        while len(self._jobs) > self._max_history:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest["status"] in ("queued", "running"):
+                break
+            del self._jobs[oldest_id]
+            self._done_events.pop(oldest_id, None)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+            # Give a burst of requests the chance to join the queued job
+            time.sleep(self._debounce)
+            with self._lock:
+                tenant, job_id = self._pending.popitem(last=False)
+                job = self._jobs[job_id]
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                full = job["full"]
+
+            # The job's spans are traced under its ID (GET /traces/{job_id})
+            trace_token = metrics.request_id_var.set(job_id)
+            try:
+                result = self._run_job(tenant, full)
+                status, error = "done", None
+            except Exception as e:
+                print(f"Index job {job['id']} failed: {str(e)}")
+                result, status, error = None, "failed", str(e)
+            finally:
+                metrics.request_id_var.reset(trace_token)
+
+            with self._lock:
+                job["status"] = status
+                job["result"] = result
+                job["error"] = error
+                job["finished_at"] = time.time()
+                job["duration_s"] = round(job["finished_at"] - job["started_at"], 3)
+                event = self._done_events.get(job["id"])
+            if event is not None:
+                event.set()
@@ -0,0 +1,226 @@
+"""
+Streaming ingestion pipeline: discover -> parse & split -> embed & insert.
+
+Files are parsed on a process pool and handed to the embedding stage through a
+bounded queue, and chunks are embedded in fixed-size batches. Only a window of
+parsed files and one batch are held in memory at a time, however large the corpus.
+
+Kept free of the heavier imports in mortgage_analysis so parse workers start quickly.
+"""
+import os
+import time
+import queue
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from metrics import span, record_span, embedded_chunks
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Parsed files allowed to wait between the parse and embed stages
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+
+# -----------------------
+# PARSE & SPLIT (runs in worker processes)
+# -----------------------
+def file_fingerprint(path):
+    stats = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return {"size": stats.st_size, "mtime": stats.st_mtime, "sha256": digest.hexdigest()}
+
+def load_file_documents(path):
+    if path.lower().endswith(".pdf"):
+        loader = PyPDFLoader(path)
+    else:
+        loader = TextLoader(path, autodetect_encoding=True)
+    return loader.load()
+
+def split_documents(docs):
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        is_separator_regex=False,
+    )
+    return text_splitter.split_documents(docs)
+
+def chunk_ids_for(path, sha256, count):
+    return [hashlib.sha1(f"{path}|{sha256}|{i}".encode()).hexdigest() for i in range(count)]
+
+def parse_file(path):
+    """Fingerprint, load and split one file into plain (picklable) chunk records."""
+    started = time.perf_counter()
+    fingerprint = file_fingerprint(path)
+    docs = load_file_documents(path)
+    loaded = time.perf_counter()
+    split_docs = split_documents(docs)
+    timings = {"load_s": loaded - started, "split_s": time.perf_counter() - loaded}
+    ids = chunk_ids_for(path, fingerprint["sha256"], len(split_docs))
+    chunks = []
+    for doc, chunk_id in zip(split_docs, ids):
+        metadata = {**doc.metadata, "source": path, "chunk_id": chunk_id}
+        chunks.append((chunk_id, doc.page_content, metadata))
+    return {"path": path, "fingerprint": fingerprint, "chunks": chunks, "error": None, "timings": timings}
+
+# -----------------------
+# PIPELINE STAGES
+# -----------------------
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def parse_pool(workers=INGEST_WORKERS):
+    """
+    The process pool shared by every index job, started on first use. Workers start once and
+    are reused, so each job does not pay for spawning processes and importing the parsers again.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # Spawn rather than fork: the server process already runs torch and executor threads
+            context = multiprocessing.get_context("spawn")
+            _parse_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _parse_pool
+
+def discard_parse_pool(pool):
+    """Drop a pool whose worker died, so the next job starts a fresh one."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def parse_files(paths, workers=INGEST_WORKERS):
+    """
+    Yield parsed files as they complete. At most 2 * `workers` files are in flight,
+    and a file that fails to parse is yielded with `error` set instead of aborting the run.
+    Files not yet started are cancelled if the consumer stops early.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            try:
+                yield parse_file(path)
+            except Exception as e:
+                yield {"path": path, "fingerprint": None, "chunks": [], "error": str(e)}
+        return
+
+    pool = parse_pool(workers)
+    remaining = iter(paths)
+    in_flight = {}
+
+    def refill():
+        while len(in_flight) < 2 * workers:
+            path = next(remaining, None)
+            if path is None:
+                return
+            in_flight[pool.submit(parse_file, path)] = path
+
+    try:
+        refill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool as e:
+                    discard_parse_pool(pool)
+                    raise RuntimeError(f"Parse worker died while parsing {path}") from e
+                except Exception as e:
+                    yield {"path": path, "fingerprint": None, "chunks": [], "error": str(e)}
+            refill()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+def prefetch(items, maxsize=INGEST_QUEUE_SIZE):
+    """
+    Run the `items` generator on a background thread, handing results over a bounded queue.
+    If the consumer stops early (or raises), the producer stops too and `items` is closed.
+    """
+    handoff = queue.Queue(maxsize=maxsize)
+    finished = object()
+    stop = threading.Event()
+    failure = []
+
+    def offer(item):
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not offer(item):
+                    return
+        except Exception as e:
+            failure.append(e)
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            offer(finished)
+
+    threading.Thread(target=produce, name="ingest-parse", daemon=True).start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is finished:
+                break
+            yield item
+    finally:
+        stop.set()
+        # Parsed files nobody will embed can be freed now rather than with the generator
+        while not handoff.empty():
+            handoff.get_nowait()
+    if failure:
+        raise failure[0]
+
+def batch_chunks(parsed_files, batch_size, on_file, on_error):
+    """Regroup chunks from consecutive files into embedding batches of `batch_size`."""
+    batch = []
+    for parsed in parsed_files:
+        if parsed["error"]:
+            on_error(parsed["path"], parsed["error"])
+            continue
+        # Parsing may have run in a worker process, so its timings are recorded here
+        name = os.path.basename(parsed["path"])
+        record_span("load_documents", parsed["timings"]["load_s"], file=name)
+        record_span("split_documents", parsed["timings"]["split_s"], file=name, chunks=len(parsed["chunks"]))
+        on_file(parsed)
+        for chunk in parsed["chunks"]:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def ingest(vectordb, paths, on_file, on_error, workers=INGEST_WORKERS, batch_size=EMBED_BATCH_SIZE):
+    """
+    Stream `paths` through parse -> split -> embed -> insert.
+    `on_file(parsed)` runs before a file's chunks are inserted; `on_error(path, error)` for files that failed.
+    Returns the number of chunks inserted.
+    """
+    inserted = 0
+    parsed_files = prefetch(parse_files(paths, workers))
+    for batch in batch_chunks(parsed_files, batch_size, on_file, on_error):
+        ids, texts, metadatas = zip(*batch)
+        # Embeds the batch (see the embed_batch span) and writes it to the collection
+        with span("index_write", chunks=len(batch)):
+            vectordb.add_texts(list(texts), metadatas=list(metadatas), ids=list(ids))
+        embedded_chunks.inc(len(batch))
+        inserted += len(batch)
+    return inserted
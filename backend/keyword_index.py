@@ -0,0 +1,115 @@
+"""
+In-process BM25 keyword index over the same chunks as the Chroma collection.
+
+Exact mortgage terms ("cash to close", "APR", "escrow") are often lost by small
+sentence embeddings; keyword scores catch them, and the two rankings are fused.
+"""
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "give",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "that", "the", "this", "to",
+    "what", "when", "which", "will", "with", "you", "your",
+}
+
+
+def tokenize(text: str):
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._chunks = {}                   # chunk_id -> {"source": str, "length": int}
+        self._postings = defaultdict(dict)  # term -> {chunk_id: term frequency}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def add(self, chunk_id: str, text: str, source: str):
+        terms = Counter(tokenize(text))
+        with self._lock:
+            if chunk_id in self._chunks:
+                self._remove_chunk(chunk_id)
+            length = sum(terms.values())
+            self._chunks[chunk_id] = {"source": source, "length": length, "terms": list(terms)}
+            self._total_length += length
+            for term, freq in terms.items():
+                self._postings[term][chunk_id] = freq
+
+    def remove_source(self, source: str):
+        with self._lock:
+            for chunk_id in [cid for cid, chunk in self._chunks.items() if chunk["source"] == source]:
+                self._remove_chunk(chunk_id)
+
+    def _remove_chunk(self, chunk_id):
+        chunk = self._chunks.pop(chunk_id)
+        self._total_length -= chunk["length"]
+        for term in chunk["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, k: int = 10, source: str = None):
+        """Return up to `k` (chunk_id, score) pairs, best first, optionally limited to one source."""
+        with self._lock:
+            n = len(self._chunks)
+            if not n:
+                return []
+            avg_length = self._total_length / n
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, freq in postings.items():
+                    chunk = self._chunks[chunk_id]
+                    if source is not None and chunk["source"] != source:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * chunk["length"] / avg_length)
+                    scores[chunk_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def save(self, path: str):
+        with self._lock:
+            data = {
+                "chunks": self._chunks,
+                "postings": self._postings,
+            }
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        index = cls()
+        with open(path) as f:
+            data = json.load(f)
+        index._chunks = data["chunks"]
+        index._postings = defaultdict(dict, data["postings"])
+        index._total_length = sum(chunk["length"] for chunk in index._chunks.values())
+        return index
+
+
+def reciprocal_rank_fusion(rankings, weights, rrf_k: int = 60):
+    """
+    Fuse ranked lists of IDs: score(id) = sum(weight / (rrf_k + rank)) over the lists containing it.
+    Returns (id, score) pairs, best first.
+    """
+    fused = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] += weight / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,95 @@
+"""
+LRU pool of open per-tenant knowledge bases.
+
+Opening a tenant loads its Chroma collection and keyword index into memory, so only the
+`max_open` most recently used tenants are kept open; the least recently used one is
+dropped when another tenant needs a slot and reopened from disk on its next request.
+
+Requests should use `reading(tenant)`: the knowledge base is registered as read (its
+`acquire()`/`release()`) for the duration, so a rebuild swapped in meanwhile cannot
+delete the version the request is still using. A knowledge base dropped from the pool
+(evicted, or replaced by `put`) is `retire()`d, which closes it once its last reader is done.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class KnowledgeBasePool:
+    def __init__(self, open_tenant, max_open: int = 8):
+        """`open_tenant(tenant)` opens (building if needed) and returns a tenant's knowledge base."""
+        self._open_tenant = open_tenant
+        self.max_open = max(1, max_open)
+        self._lock = threading.Lock()
+        self._open = OrderedDict()   # tenant -> knowledge base, least recently used first
+        self._opening = {}           # tenant -> lock held while that tenant is being opened
+        self.counters = {"hits": 0, "opens": 0, "evictions": 0}
+
+    def get(self, tenant: str, acquire: bool = False):
+        """Return the tenant's open knowledge base, opening it if needed. With `acquire`, also register a reader."""
+        kb = self._lookup(tenant, acquire)
+        if kb is not None:
+            return kb
+        with self._lock:
+            opening = self._opening.setdefault(tenant, threading.Lock())
+        # Opening can take seconds; only requests for the same tenant wait on it
+        with opening:
+            kb = self._lookup(tenant, acquire)
+            if kb is not None:
+                return kb
+            kb = self._open_tenant(tenant)
+            with self._lock:
+                dropped = self._install(tenant, kb)
+                if acquire:
+                    kb.acquire()
+                self.counters["opens"] += 1
+                self._opening.pop(tenant, None)
+            self._retire(dropped)
+            return kb
+
+    @contextmanager
+    def reading(self, tenant: str):
+        kb = self.get(tenant, acquire=True)
+        try:
+            yield kb
+        finally:
+            kb.release()
+
+    def _lookup(self, tenant, acquire):
+        with self._lock:
+            kb = self._open.get(tenant)
+            if kb is not None:
+                self._open.move_to_end(tenant)
+                self.counters["hits"] += 1
+                if acquire:
+                    # Under the pool lock, so a concurrent put() cannot swap it out first
+                    kb.acquire()
+            return kb
+
+    def put(self, tenant: str, kb):
+        """Install `kb` as the tenant's open knowledge base, e.g. after a full rebuild."""
+        with self._lock:
+            dropped = self._install(tenant, kb)
+        self._retire(dropped)
+
+    def _install(self, tenant, kb):
+        """Install `kb`; returns the knowledge bases it pushed out of the pool."""
+        dropped = []
+        previous = self._open.pop(tenant, None)
+        if previous is not None and previous is not kb:
+            dropped.append(previous)
+        self._open[tenant] = kb
+        while len(self._open) > self.max_open:
+            dropped.append(self._open.popitem(last=False)[1])
+            self.counters["evictions"] += 1
+        return dropped
+
+    def _retire(self, dropped):
+        # Outside the pool lock: closing may stop a Chroma system. Requests already holding
+        # a dropped knowledge base keep using it; it is closed once the last of them finishes
+        for kb in dropped:
+            kb.retire()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "open": list(self._open), "max_open": self.max_open}
@@ -0,0 +1,184 @@
+"""
+Chat-completion client for Azure OpenAI (or the OpenAI API).
+
+One pooled HTTP client is shared by every request. Each call has a timeout and is
+retried with exponential backoff on 429/5xx and network errors, honouring Retry-After
+unless it is longer than the call timeout, in which case the call fails straight away.
+A token bucket shared by all threads keeps the request rate under the deployment's
+quota. Failures raise LLMError; they are never returned as answer text.
+"""
+import os
+import json
+import time
+import random
+import threading
+
+import httpx
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The model could not produce an answer (after retries)."""
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` requests per minute on average, with bursts up to `burst`."""
+
+    def __init__(self, rate_per_minute: float, burst: int = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute // 6))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds`, e.g. after the server answered 429."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            if time.monotonic() + wait > deadline:
+                raise LLMError("Rate limiter: no request slot available before the timeout")
+            time.sleep(min(wait, 1.0))
+
+
+class LLMClient:
+    def __init__(self, api_type: str, api_base: str, api_key: str, api_version: str, deployment: str,
+                 timeout: float = 60, max_retries: int = 4, requests_per_minute: float = 300,
+                 max_connections: int = 20):
+        self.api_type = api_type
+        self.deployment = deployment
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(requests_per_minute)
+        if api_type == "azure":
+            self.url = f"{api_base.rstrip('/')}/openai/deployments/{deployment}/chat/completions"
+            self.params = {"api-version": api_version}
+            headers = {"api-key": api_key}
+        else:
+            self.url = f"{api_base.rstrip('/')}/v1/chat/completions"
+            self.params = {}
+            headers = {"Authorization": f"Bearer {api_key}"}
+        self.http = httpx.Client(
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    @classmethod
+    def from_env(cls):
+        api_type = os.getenv("OPENAI_API_TYPE", "azure")
+        return cls(
+            api_type=api_type,
+            api_base=os.getenv("OPENAI_API_BASE", "https://oai-ofcresearch-sandbox.openai.azure.com"),
+            api_key=os.getenv("OPENAI_API_KEY", ""),
+            api_version=os.getenv("OPENAI_API_VERSION", "2024-12-01-preview"),
+            deployment=os.getenv("OPENAI_DEPLOYMENT", "gpt-4o-mini"),
+            timeout=float(os.getenv("LLM_CALL_TIMEOUT", "60")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "300")),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+        )
+
+    def _body(self, prompt: str, temperature: float, stream: bool):
+        body = {"messages": [{"role": "user", "content": prompt}], "temperature": temperature}
+        if self.api_type != "azure":
+            body["model"] = self.deployment
+        if stream:
+            body["stream"] = True
+        return body
+
+    def _backoff(self, attempt: int, response: httpx.Response = None) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _send(self, prompt: str, temperature: float, stream: bool):
+        """Send the request, retrying transient failures. Returns an open (streaming) response."""
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(self.timeout)
+            request = self.http.build_request(
+                "POST", self.url, params=self.params, json=self._body(prompt, temperature, stream)
+            )
+            try:
+                response = self.http.send(request, stream=True)
+            except httpx.HTTPError as e:
+                last_error = f"{type(e).__name__}: {e}"
+                if attempt < self.max_retries:
+                    time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code < 400:
+                return response
+            response.read()
+            last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+            response.close()
+            if response.status_code not in RETRYABLE_STATUS:
+                break
+            delay = self._backoff(attempt, response)
+            if delay > self.timeout:
+                # A Retry-After longer than a whole call is not worth waiting for, nor pausing every thread for
+                raise LLMError(f"LLM request failed: {last_error} (retry after {delay:.0f}s)")
+            if response.status_code == 429:
+                # Every thread backs off, not only the one that was throttled
+                self.limiter.pause(delay)
+            # No point waiting after the last attempt: the caller gets the error straight away
+            if attempt < self.max_retries:
+                time.sleep(delay)
+        raise LLMError(f"LLM request failed: {last_error}")
+
+    def chat(self, prompt: str, temperature: float = 0.1, usage: dict = None) -> str:
+        """Return the completion text. `usage`, if given, accumulates prompt/completion token counts."""
+        response = self._send(prompt, temperature, stream=False)
+        try:
+            data = json.loads(response.read())
+        except ValueError as e:
+            raise LLMError(f"LLM returned invalid JSON: {e}")
+        finally:
+            response.close()
+        if usage is not None and data.get("usage"):
+            usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + data["usage"].get("prompt_tokens", 0)
+            usage["completion_tokens"] = usage.get("completion_tokens", 0) + data["usage"].get("completion_tokens", 0)
+        try:
+            return data["choices"][0]["message"]["content"] or ""
+        except (KeyError, IndexError) as e:
+            raise LLMError(f"LLM response missing content: {e}")
+
+    def stream_chat(self, prompt: str, temperature: float = 0.1):
+        """Yield completion text as it arrives. Retries only happen before the first token."""
+        response = self._send(prompt, temperature, stream=True)
+        try:
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                if chunk.get("choices"):
+                    token = chunk["choices"][0].get("delta", {}).get("content")
+                    if token:
+                        yield token
+        except (httpx.HTTPError, ValueError) as e:
+            raise LLMError(f"LLM stream interrupted: {e}")
+        finally:
+            response.close()
+
+    def close(self):
+        self.http.close()
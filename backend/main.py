@@ -1,22 +1,59 @@
+import time
+_import_started = time.perf_counter()
+
 import os
-from fastapi import FastAPI, UploadFile, HTTPException, File
+import asyncio
+import threading
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response, PlainTextResponse
 from dotenv import load_dotenv
 from supabase import create_client, Client
+import re
 import uuid
+import hashlib
 import tempfile
 import shutil
 from pathlib import Path
+from urllib.parse import quote
+from datetime import datetime
 import json
+import anyio
+from multipart.multipart import MultipartParser, parse_options_header
 
 # Import mortgage analysis functionality
-from mortgage_analysis import create_vector_db, ask_mortgage_query, extract_summary_points
+from mortgage_analysis import (
+    create_vector_db, update_vector_db, sync_vector_db, indexed_chunk_count, load_manifest, current_manifest, collect_index_versions,
+    ask_mortgage_query, extract_summary_points, extract_document_summaries,
+    get_embeddings, embeddings_loaded, warm_up_embeddings, answer_cache, make_answer_policy,
+    get_verification_stats, token_ledger, audit_log, new_request_id, DEFAULT_TENANT, validate_tenant, tenant_data_path
+)
+from index_jobs import IndexJobQueue
+from knowledge_base_pool import KnowledgeBasePool
+from llm_client import LLMError
+from storage_sync import StorageClient, DirectorySync
+from blob_cache import BlobCache
+from document_catalog import DocumentCatalog, new_entry, DEFAULT_PAGE_SIZE
+import metrics
+
+# Seconds spent in each startup phase, reported by GET /ready
+startup_timings = {"import_s": round(time.perf_counter() - _import_started, 3)}
 
 load_dotenv()
 
 app = FastAPI()
 
+# Uploads above this many bytes are rejected with 413, before or while the body arrives
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+# Room for multipart framing (boundaries, part headers, other fields) on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# PDFs are streamed to clients this many bytes at a time
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Blocking work (embedding, PDF parsing, LLM calls, storage I/O) runs on this many worker threads
+API_THREADPOOL_SIZE = int(os.getenv("API_THREADPOOL_SIZE", "40"))
+
 # Configure CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -26,114 +63,452 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Incoming X-Request-ID values are reused only if they look like an ID
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class RequestContextMiddleware:
+    """
+    Give every request an ID (the caller's X-Request-ID, or a new one) that the pipeline's
+    spans and audit records are tagged with, echo it back as X-Request-ID, and time the request.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        request_id = incoming if REQUEST_ID_PATTERN.match(incoming) else new_request_id()
+        token = metrics.request_id_var.set(request_id)
+        started = time.perf_counter()
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+                endpoint = scope.get("endpoint")
+                metrics.http_request_seconds.observe(
+                    time.perf_counter() - started,
+                    endpoint=endpoint.__name__ if endpoint else "unmatched",
+                    method=scope["method"],
+                    status=message["status"],
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            metrics.request_id_var.reset(token)
+
+app.add_middleware(RequestContextMiddleware)
+
 # Initialize Supabase client
 supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_KEY")
 bucket_name = "mortgage-uploads"  # Using the existing bucket
 supabase: Client = create_client(supabase_url, supabase_key)
+# Streaming client used for file transfers (uploads and sync)
+storage_client = StorageClient(supabase_url, supabase_key, bucket_name)
 
 # Create data directory if it doesn't exist
 os.makedirs("data", exist_ok=True)
 
-# Initialize vector database
-vectordb = None
-try:
-    vectordb = create_vector_db()
-    print("Vector database initialized successfully")
-except Exception as e:
-    print(f"Error initializing vector database: {str(e)}")
+# Load the embedding model and open the default tenant's index at startup instead of on the first request
+WARM_START = os.getenv("WARM_START", "true").lower() in ("1", "true", "yes")
+# Tenants whose index stays open in memory; the least recently used is dropped beyond this
+MAX_OPEN_TENANTS = int(os.getenv("MAX_OPEN_TENANTS", "8"))
+model_lock = threading.Lock()
+# Set once the default tenant's index has been opened; it stays set if the pool later evicts it
+default_index_loaded = threading.Event()
+
+def open_tenant(tenant):
+    with model_lock:
+        if not embeddings_loaded():
+            started = time.perf_counter()
+            warm_up_embeddings()
+            startup_timings["model_load_s"] = round(time.perf_counter() - started, 3)
+    started = time.perf_counter()
+    kb = create_vector_db(tenant)
+    if tenant == DEFAULT_TENANT:
+        startup_timings["index_open_s"] = round(time.perf_counter() - started, 3)
+        default_index_loaded.set()
+    print(f"Vector database for tenant '{tenant}' initialized successfully")
+    return kb
+
+# Open per-tenant knowledge bases (vector collection + keyword index)
+knowledge_bases = KnowledgeBasePool(open_tenant, max_open=MAX_OPEN_TENANTS)
+
+def get_vector_db(tenant=DEFAULT_TENANT):
+    """Return the tenant's open index, waiting for or performing its load if needed."""
+    return knowledge_bases.get(tenant)
+
+def with_knowledge_base(tenant, fn, *args, **kwargs):
+    """
+    Run `fn(kb, *args, **kwargs)` against the tenant's current index version, holding a read
+    reference so a rebuild finishing meanwhile cannot delete it mid-query
+    """
+    with knowledge_bases.reading(tenant) as kb:
+        return fn(kb, *args, **kwargs)
+
+def warm_start():
+    try:
+        get_vector_db()
+        print(f"⏱️ Startup timings: {startup_timings}")
+    except Exception as e:
+        print(f"Error initializing vector database: {str(e)}")
+
+def storage_timestamp(value):
+    """Supabase reports times as ISO 8601 strings; the catalog keeps epoch seconds."""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+def load_local_catalog(tenant):
+    """Catalog entries for the tenant's local PDFs, with their index status from the manifest."""
+    entries = {}
+    for file_path in tenant_dir(tenant).glob("*.pdf"):
+        stats = file_path.stat()
+        entry = entries[file_path.name] = new_entry(file_path.name)
+        entry.update(local=True, size_bytes=stats.st_size, modified_at=stats.st_mtime, uploaded_at=stats.st_ctime)
+    for path, indexed in current_manifest(tenant).items():
+        entry = entries.get(os.path.basename(path))
+        if entry is not None:
+            entry.update(indexed=True, chunks=indexed.get("chunks", 0), sha256=indexed.get("sha256"))
+    return list(entries.values())
+
+def load_remote_catalog(tenant):
+    """The tenant's PDFs in Supabase, as the catalog's remote listing."""
+    prefix = "" if tenant == DEFAULT_TENANT else tenant
+    return [
+        {
+            "filename": item["name"],
+            "size_bytes": (item.get("metadata") or {}).get("size"),
+            "uploaded_at": storage_timestamp(item.get("created_at")),
+        }
+        for item in storage_client.list(prefix)
+        if item["name"].lower().endswith(".pdf")
+    ]
+
+# Listings are served from here; uploads, deletes, syncs and index jobs keep it current
+catalog = DocumentCatalog(load_local_catalog, load_remote_catalog)
+
+def refresh_catalog_index(tenant, manifest):
+    catalog.apply_manifest(tenant, {os.path.basename(path): entry for path, entry in manifest.items()})
+
+def run_index_job(tenant, full):
+    """
+    Build the tenant's next index version and only then swap it in for the endpoints to use.
+    The previous version is deleted once the last query reading it finishes.
+    """
+    if full:
+        kb = update_vector_db(tenant)
+        knowledge_bases.put(tenant, kb)
+        collect_index_versions(kb.chroma_path)
+        refresh_catalog_index(tenant, load_manifest(kb))
+        return {"full_rebuild": True, "version": kb.version, "total_chunks": indexed_chunk_count(kb)}
+    with knowledge_bases.reading(tenant) as kb:
+        kb, changes = sync_vector_db(kb)
+        refresh_catalog_index(tenant, load_manifest(kb))
+        return {**changes, "version": kb.version, "total_chunks": indexed_chunk_count(kb)}
+
+# Uploads, deletes and syncs queue index passes here instead of rebuilding inline
+index_jobs = IndexJobQueue(run_index_job, debounce=float(os.getenv("INDEX_JOB_DEBOUNCE", "1.0")))
+
+@app.on_event("startup")
+async def configure_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADPOOL_SIZE
+
+@app.on_event("startup")
+async def start_warm_start():
+    # Serve requests (and /ready) straight away while the model and index load
+    if WARM_START:
+        threading.Thread(target=warm_start, name="warm-start", daemon=True).start()
+
+def upload_part_filename(headers):
+    """The filename of a multipart part named `file`, or None for any other part."""
+    _, options = parse_options_header(headers.get(b"content-disposition", b""))
+    if options.get(b"name") != b"file":
+        return None
+    return os.path.basename(options.get(b"filename", b"").decode("utf-8", "replace"))
+
+def write_upload_blocks(f, digest, blocks):
+    for block in blocks:
+        digest.update(block)
+        f.write(block)
+
+async def receive_upload(request, data_dir, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Stream the `file` part of a multipart/form-data request body into a temporary file in
+    `data_dir`, hashing it on the way; the body is parsed as it arrives and never spooled.
+    Returns (uploaded filename, temporary path, SHA-256, size). Raises 413 as soon as the
+    declared Content-Length or the bytes received exceed `max_bytes`, and 400 for a body
+    without a `.pdf` file part.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body with a 'file' field")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+
+    state = {"headers": {}, "field": b"", "value": b"", "in_file": False, "filename": None}
+    blocks = []   # file data parsed from the current network chunk, written once the parser returns
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        filename = upload_part_filename(state["headers"])
+        state["in_file"] = filename is not None and state["filename"] is None
+        if state["in_file"]:
+            state["filename"] = filename
+
+    def on_part_data(data, start, end):
+        if state["in_file"]:
+            blocks.append(bytes(data[start:end]))
+
+    def on_part_end():
+        state["in_file"] = False
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data, "on_part_end": on_part_end,
+    })
+    tmp_path = data_dir / f".upload-{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = received = 0
+    f = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes + MULTIPART_OVERHEAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+            parser.write(chunk)
+            if state["filename"] is not None and not state["filename"].lower().endswith(".pdf"):
+                raise HTTPException(status_code=400, detail="File must be a PDF")
+            if blocks:
+                size += sum(len(block) for block in blocks)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+                await run_in_threadpool(write_upload_blocks, f, digest, list(blocks))
+                blocks.clear()
+        parser.finalize()
+        if state["filename"] is None:
+            raise HTTPException(status_code=400, detail="Form must include a 'file' field")
+        await run_in_threadpool(f.close)
+    except BaseException:
+        f.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return state["filename"], tmp_path, digest.hexdigest(), size
+
+def tenant_or_400(tenant=None):
+    try:
+        return validate_tenant(tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def tenant_dir(tenant):
+    data_dir = Path(tenant_data_path(tenant))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+def storage_path(tenant, filename):
+    """Object path in the bucket; the default tenant keeps files at the bucket root."""
+    return filename if tenant == DEFAULT_TENANT else f"{tenant}/{filename}"
 
 @app.get("/")
 async def root():
     return {"message": "PDF Storage API is running"}
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the embedding model and vector index are loaded, 503 before
+    """
+    status = {
+        "model_loaded": embeddings_loaded(),
+        "index_loaded": default_index_loaded.is_set(),
+        "startup_timings": startup_timings,
+    }
+    status["ready"] = status["model_loaded"] and status["index_loaded"]
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 @app.post("/upload-pdf/")
-async def upload_pdf(file: UploadFile):
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="File must be a PDF")
+async def upload_pdf(request: Request, tenant: str = None):
+    """
+    Store a PDF (the `file` field of a multipart form) for `tenant` (default: the shared default tenant)
+    and index it into that tenant's collection only
+    """
+    tenant = tenant_or_400(tenant)
     
     try:
-        # Read file content
-        content = await file.read()
+        data_dir = tenant_dir(tenant)
+        upload_filename, tmp_path, sha256, size = await receive_upload(request, data_dir)
+        
+        # The same bytes already stored for this tenant: keep the existing copy, nothing to re-index
+        manifest = await run_in_threadpool(current_manifest, tenant)
+        duplicate = next(
+            (path for path, entry in manifest.items() if entry["sha256"] == sha256 and os.path.exists(path)), None
+        )
+        if duplicate is None:
+            # Uploaded but not indexed yet: only the catalog has its hash
+            entry = await run_in_threadpool(
+                catalog.find, tenant, lambda entry: entry["local"] and entry["sha256"] == sha256
+            )
+            if entry is not None and (data_dir / entry["filename"]).exists():
+                duplicate = str(data_dir / entry["filename"])
+        if duplicate is not None:
+            os.remove(tmp_path)
+            filename = os.path.basename(duplicate)
+            return {
+                "message": "PDF already uploaded",
+                "tenant": tenant,
+                "file_id": filename.split("_", 1)[0],
+                "filename": filename,
+                "url": supabase.storage.from_(bucket_name).get_public_url(storage_path(tenant, filename)),
+                "duplicate": True,
+                "index_job_id": None
+            }
         
         # Generate unique filename
         file_id = str(uuid.uuid4())
-        filename = f"{file_id}_{file.filename}"
+        filename = f"{file_id}_{upload_filename}"
         
-        # Save the PDF locally in the data directory for analysis
-        pdf_path = os.path.join("data", filename)
-        with open(pdf_path, "wb") as f:
-            f.write(content)
+        # Move the PDF into the data directory for analysis
+        pdf_path = data_dir / filename
+        os.replace(tmp_path, pdf_path)
         
-        # Upload to Supabase
-        supabase.storage.from_(bucket_name).upload(
-            path=filename,
-            file=content,
-            file_options={"content-type": "application/pdf"}
-        )
+        # Upload to Supabase, streamed from the file on disk
+        await run_in_threadpool(storage_client.upload, storage_path(tenant, filename), str(pdf_path))
         
         # Get the public URL
-        file_url = supabase.storage.from_(bucket_name).get_public_url(filename)
+        file_url = supabase.storage.from_(bucket_name).get_public_url(storage_path(tenant, filename))
+        
+        catalog.update(
+            tenant, filename, local=True, remote=True, size_bytes=size, sha256=sha256,
+            indexed=False, chunks=0, uploaded_at=time.time(), modified_at=pdf_path.stat().st_mtime
+        )
         
-        # Update the vector database with the new document
-        global vectordb
-        from mortgage_analysis import update_vector_db
-        vectordb = update_vector_db()
+        # Index in the background; bursts of uploads share one index pass
+        job_id = index_jobs.submit(tenant, reason=f"upload {filename}")
         
         return {
             "message": "PDF uploaded successfully",
+            "tenant": tenant,
             "file_id": file_id,
             "filename": filename,
-            "url": file_url
+            "url": file_url,
+            "size_bytes": size,
+            "sha256": sha256,
+            "duplicate": False,
+            "index_job_id": job_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to upload PDF: {str(e)}")
 
+def catalog_filter(location, q=None, indexed=None):
+    """Catalog predicate for a listing: documents in `location` ("remote" or "local"), optionally filtered."""
+    q = q.lower() if q else None
+    return lambda entry: (
+        entry[location]
+        and (q is None or q in entry["filename"].lower())
+        and (indexed is None or entry["indexed"] == indexed)
+    )
+
 @app.get("/pdfs/")
-async def list_pdfs():
+async def list_pdfs(tenant: str = None, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE,
+                    q: str = None, indexed: bool = None):
+    """
+    The tenant's PDFs in Supabase, in filename order, a page at a time. Pass `next_cursor` back as `cursor`
+    for the next page. `q` filters on a filename substring, `indexed` on index status.
+    """
+    tenant = tenant_or_400(tenant)
     try:
-        response = supabase.storage.from_(bucket_name).list()
-        return {"files": response}
+        files, next_cursor = await run_in_threadpool(
+            catalog.page, tenant, cursor, limit, catalog_filter("remote", q, indexed), need_remote=True
+        )
+        return {"files": files, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list PDFs: {str(e)}")
         
 @app.delete("/pdfs/{filename}")
-async def delete_pdf(filename: str):
+async def delete_pdf(filename: str, tenant: str = None):
+    tenant = tenant_or_400(tenant)
     try:
         # Remove from Supabase
-        supabase.storage.from_(bucket_name).remove([filename])
+        await run_in_threadpool(supabase.storage.from_(bucket_name).remove, [storage_path(tenant, filename)])
         
         # Remove from local data directory if it exists
-        local_file_path = Path("data") / filename
-        if local_file_path.exists():
-            local_file_path.unlink()
+        local_file_path = tenant_dir(tenant) / filename
+        local_file_path.unlink(missing_ok=True)
+        pdf_cache.discard(f"{tenant}/{filename}")
+        catalog.remove(tenant, filename)
         
-        # Update the vector database after deletion
-        global vectordb
-        from mortgage_analysis import update_vector_db
-        vectordb = update_vector_db()
+        # Drop the deleted document's chunks in the background
+        job_id = index_jobs.submit(tenant, reason=f"delete {filename}")
         
-        return {"message": f"PDF {filename} deleted successfully"}
+        return {"message": f"PDF {filename} deleted successfully", "index_job_id": job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete PDF: {str(e)}")
 
+def answer_policy_or_400(mode=None, samples=None, quorum=None):
+    try:
+        return make_answer_policy(mode, samples, quorum)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/analyze-mortgage/")
-async def analyze_mortgage():
+async def analyze_mortgage(refresh: bool = False, per_document: bool = False,
+                           mode: str = None, samples: int = None, quorum: int = None, tenant: str = None):
     """
-    Analyze all documents in the data directory and extract key mortgage details
+    Analyze all documents in the data directory and extract key mortgage details.
+    The result is reused until the indexed document set changes, unless `refresh=true`.
+    With `per_document=true`, details are extracted separately for each document.
+    `mode` selects the answer policy (fast, vote-n or adaptive); `samples`/`quorum` tune voting.
+    Only `tenant`'s documents are analyzed.
     """
-    global vectordb
-    
+    policy = answer_policy_or_400(mode, samples, quorum)
+    tenant = tenant_or_400(tenant)
     try:
-        # Ensure vector database is initialized
-        if vectordb is None:
-            vectordb = create_vector_db()
+        if per_document:
+            stats = {}
+            documents = await run_in_threadpool(
+                with_knowledge_base, tenant, extract_document_summaries, stats=stats, use_cache=not refresh, policy=policy
+            )
+            return {"documents": documents, "mode": stats.get("mode"), "llm_calls": stats.get("llm_calls", 0)}
         
         # Extract key mortgage details
-        summary = extract_summary_points(vectordb)
+        stats = {}
+        summary = await run_in_threadpool(
+            with_knowledge_base, tenant, extract_summary_points, stats=stats, use_cache=not refresh, policy=policy
+        )
         
-        return summary
+        return {
+            **summary,
+            "mode": stats.get("mode", policy["mode"]),
+            "llm_calls": stats.get("llm_calls", 0),
+            "cache": stats.get("cache"),
+            "request_id": stats.get("request_id") or metrics.current_request_id()
+        }
+    except LLMError as e:
+        print(f"Analysis error: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Language model unavailable: {str(e)}")
     except Exception as e:
         print(f"Analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to analyze mortgage documents: {str(e)}")
@@ -141,163 +516,370 @@ async def analyze_mortgage():
 @app.post("/ask-query/")
 async def ask_query(query: dict):
     """
-    Ask a specific question about the mortgage documents
+    Ask a specific question about the mortgage documents.
+    Optional `mode` (fast, vote-n or adaptive), `samples` and `quorum` fields select the answer policy,
+    and `tenant` selects whose documents are searched.
     """
-    global vectordb
-    
     if "question" not in query:
         raise HTTPException(status_code=400, detail="Query must include a 'question' field")
+    policy = answer_policy_or_400(query.get("mode"), query.get("samples"), query.get("quorum"))
+    tenant = tenant_or_400(query.get("tenant"))
     
     try:
-        # Ensure vector database is initialized
-        if vectordb is None:
-            vectordb = create_vector_db()
-        
         # Get answer to user's query
-        answer = ask_mortgage_query(query["question"], vectordb)
+        stats = {}
+        answer = await run_in_threadpool(
+            with_knowledge_base, tenant, lambda kb: ask_mortgage_query(query["question"], kb, stats=stats, policy=policy)
+        )
         
-        return {"question": query["question"], "answer": answer}
+        return {
+            "question": query["question"],
+            "answer": answer,
+            "mode": stats.get("mode"),
+            "escalated": stats.get("escalated"),
+            "verification": stats.get("verification"),
+            "llm_calls": stats.get("llm_calls", 0),
+            "cache": stats.get("cache"),
+            "request_id": stats.get("request_id") or metrics.current_request_id()
+        }
+    except LLMError as e:
+        print(f"Query error: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Language model unavailable: {str(e)}")
     except Exception as e:
         print(f"Query error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process query: {str(e)}")
 
+@app.post("/ask-query/stream")
+async def ask_query_stream(query: dict):
+    """
+    Same as /ask-query/, but as Server-Sent Events: progress events (retrieval, attempt, vote,
+    majority, no_majority), then the verified answer as `token` events, then `done`. A `reset`
+    event means the tokens sent so far are void and the answer is streamed again from the start
+    """
+    if "question" not in query:
+        raise HTTPException(status_code=400, detail="Query must include a 'question' field")
+    policy = answer_policy_or_400(query.get("mode"), query.get("samples"), query.get("quorum"))
+    tenant = tenant_or_400(query.get("tenant"))
+    
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    
+    def emit(event, data):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+    
+    def run_query():
+        try:
+            stats = {}
+            answer = with_knowledge_base(
+                tenant, lambda kb: ask_mortgage_query(query["question"], kb, stats=stats, on_event=emit, policy=policy)
+            )
+            emit("done", {
+                "question": query["question"],
+                "answer": answer,
+                "mode": stats.get("mode"),
+                "escalated": stats.get("escalated"),
+                "verification": stats.get("verification"),
+                "llm_calls": stats.get("llm_calls", 0),
+                "cache": stats.get("cache"),
+                "request_id": stats.get("request_id") or metrics.current_request_id()
+            })
+        except Exception as e:
+            print(f"Query error: {str(e)}")
+            emit("error", {"detail": f"Failed to process query: {str(e)}"})
+        finally:
+            emit(None, None)
+    
+    async def event_stream():
+        started = time.perf_counter()
+        first_byte_s = first_token_s = None
+        worker = asyncio.ensure_future(run_in_threadpool(run_query))
+        while True:
+            event, data = await events.get()
+            if event is None:
+                break
+            elapsed = round(time.perf_counter() - started, 3)
+            if first_byte_s is None:
+                first_byte_s = elapsed
+            if event == "token" and first_token_s is None:
+                first_token_s = elapsed
+            if event == "done":
+                data = {**data, "ttfb_s": first_byte_s, "first_token_s": first_token_s, "total_s": elapsed}
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        await worker
+        print(f"⏱️ /ask-query/stream ttfb={first_byte_s}s first_token={first_token_s}s "
+              f"total={round(time.perf_counter() - started, 3)}s")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/cache-stats/")
+async def cache_stats():
+    """
+    Hit/miss counters for the answer cache, the embedding cache and the PDF cache, and the open-tenant pool
+    """
+    stats = {
+        "answer_cache": answer_cache.stats(),
+        "knowledge_bases": knowledge_bases.stats(),
+        "pdf_cache": pdf_cache.stats(),
+        "document_catalog": catalog.stats(),
+    }
+    if embeddings_loaded():
+        stats["embedding_cache"] = dict(get_embeddings().counters)
+    return stats
+
+@app.get("/verification-stats/")
+async def verification_stats():
+    """
+    How often each teacher-verification branch fired, with its token usage and time spent,
+    and the audit log writer's counters
+    """
+    return {"verification": get_verification_stats(), "audit_log": audit_log.stats()}
+
+def index_sizes():
+    """Chunks and documents in each open tenant's current index version."""
+    sizes = {}
+    for tenant in knowledge_bases.stats()["open"]:
+        manifest = current_manifest(tenant)
+        sizes[tenant] = (sum(entry.get("chunks", 0) for entry in manifest.values()), len(manifest))
+    return sizes
+
+metrics.Gauge(
+    "rag_index_chunks", "Chunks in the current index version of each open tenant", ["tenant"],
+    lambda: {(tenant,): chunks for tenant, (chunks, _) in index_sizes().items()},
+)
+metrics.Gauge(
+    "rag_index_documents", "Documents in the current index version of each open tenant", ["tenant"],
+    lambda: {(tenant,): documents for tenant, (_, documents) in index_sizes().items()},
+)
+metrics.Gauge("rag_answer_cache_entries", "Answers held by the answer cache", (),
+              lambda: {(): answer_cache.stats()["entries"]})
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Stage latency histograms, LLM call and token counters, vote agreement and index size, in Prometheus text format
+    """
+    return PlainTextResponse(await run_in_threadpool(metrics.render), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces/{request_id}")
+async def request_trace(request_id: str):
+    """
+    The pipeline spans recorded for one recent request (see the X-Request-ID response header)
+    """
+    spans = metrics.trace(request_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail=f"No trace for request {request_id}")
+    return {"request_id": request_id, "spans": spans}
+
+@app.get("/token-stats/")
+async def token_stats():
+    """
+    LLM calls and prompt/completion tokens since startup, broken down by purpose (vote, teacher, fast)
+    """
+    return {"tokens": token_ledger.snapshot()}
+
+def sync_files_with_supabase(tenant):
+    """
+    Two-way sync of the tenant's PDFs with Supabase, transferring only files that are new
+    or whose content changed. Returns {"downloaded", "uploaded", "unchanged", "conflicts", "failed"}.
+    """
+    prefix = "" if tenant == DEFAULT_TENANT else tenant
+    result = DirectorySync(storage_client, str(tenant_dir(tenant)), prefix).run()
+    # Downloaded files changed remotely; any cached copy is stale
+    for filename in result["downloaded"]:
+        pdf_cache.discard(f"{tenant}/{filename}")
+    data_dir = tenant_dir(tenant)
+    for filename in result["downloaded"] + result["uploaded"]:
+        stats = (data_dir / filename).stat()
+        catalog.update(tenant, filename, local=True, remote=True, size_bytes=stats.st_size, modified_at=stats.st_mtime)
+    return result
+
 @app.post("/sync-data/")
-async def sync_data():
+async def sync_data(tenant: str = None):
     """
-    Synchronize files between Supabase and local data directory, and rebuild the vector database
+    Synchronize the tenant's files between Supabase and its local data directory, and re-index what changed
     """
+    tenant = tenant_or_400(tenant)
     try:
-        # List files in Supabase
-        supabase_files = supabase.storage.from_(bucket_name).list()
-        supabase_filenames = {file["name"] for file in supabase_files if file.get("name")}
-        
-        # List files in data directory
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-        local_files = {file.name for file in data_dir.glob("*.pdf")}
+        result = await run_in_threadpool(sync_files_with_supabase, tenant)
         
-        # Files in Supabase but not in data
-        files_to_download = supabase_filenames - local_files
-        for filename in files_to_download:
-            try:
-                # Download from Supabase
-                content = supabase.storage.from_(bucket_name).download(filename)
-                
-                # Save locally
-                with open(data_dir / filename, "wb") as f:
-                    f.write(content)
-                print(f"Downloaded {filename} from Supabase")
-            except Exception as e:
-                print(f"Error downloading {filename}: {str(e)}")
-        
-        # Files in data but not in Supabase
-        files_to_upload = local_files - supabase_filenames
-        for filename in files_to_upload:
-            try:
-                # Read local file
-                with open(data_dir / filename, "rb") as f:
-                    content = f.read()
-                
-                # Upload to Supabase
-                supabase.storage.from_(bucket_name).upload(
-                    path=filename,
-                    file=content,
-                    file_options={"content-type": "application/pdf"}
-                )
-                print(f"Uploaded {filename} to Supabase")
-            except Exception as e:
-                print(f"Error uploading {filename}: {str(e)}")
-        
-        # Rebuild vector database
-        global vectordb
-        from mortgage_analysis import update_vector_db
-        vectordb = update_vector_db()
+        # Uploads leave local files untouched, so only downloads need re-indexing (in the background)
+        job_id = index_jobs.submit(tenant, reason="sync") if result["downloaded"] else None
         
         return {
             "message": "Data synchronized successfully",
-            "downloaded": list(files_to_download),
-            "uploaded": list(files_to_upload)
+            **result,
+            "index_job_id": job_id
         }
     except Exception as e:
         print(f"Sync error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to synchronize data: {str(e)}")
 
 @app.get("/local-pdfs/")
-async def list_local_pdfs():
+async def list_local_pdfs(tenant: str = None, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE,
+                          q: str = None, indexed: bool = None):
     """
-    List all PDF files in the local data directory
+    The PDF files in the tenant's local data directory, paginated and filtered like GET /pdfs/
     """
+    tenant = tenant_or_400(tenant)
     try:
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-        local_files = list(data_dir.glob("*.pdf"))
-        
-        # Format the results
-        files_info = []
-        for file_path in local_files:
-            # Get file stats
-            stats = file_path.stat()
-            # Add file information
-            files_info.append({
-                "filename": file_path.name,
-                "size_bytes": stats.st_size,
-                "created_at": stats.st_ctime,
-                "modified_at": stats.st_mtime
-            })
-        
-        return {"files": sorted(files_info, key=lambda x: x["modified_at"], reverse=True)}
+        files, next_cursor = await run_in_threadpool(
+            catalog.page, tenant, cursor, limit, catalog_filter("local", q, indexed)
+        )
+        return {"files": files, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list local PDFs: {str(e)}")
 
-@app.get("/pdfs/{filename}")
-async def get_pdf(filename: str):
+def parse_range(header, size):
     """
-    Get a specific PDF file by filename
+    (start, end) inclusive for a single `bytes=` range, or None to serve the whole file
+    (no header, or several ranges). Raises 416 for a range outside the file.
     """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
     try:
-        # Check if file exists in local data directory
-        local_file_path = Path("data") / filename
-        if local_file_path.exists():
-            return FileResponse(
-                path=local_file_path,
-                media_type="application/pdf",
-                filename=filename
-            )
-        
-        # If not in local directory, try to download from Supabase
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+def pdf_response(request, f, filename):
+    """
+    Serve the open PDF `f` with ETag revalidation (304) and single byte-range requests (206), so
+    viewers can fetch pages incrementally. Takes an open file, so a cache eviction while the body
+    streams does not cut it short. `f` is closed once the response is done with it.
+    """
+    stats = os.fstat(f.fileno())
+    etag = f'"{stats.st_size:x}-{stats.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        f.close()
+        return Response(status_code=304, headers=headers)
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
         try:
-            content = supabase.storage.from_(bucket_name).download(filename)
-            
-            # Save locally for future use
-            with open(local_file_path, "wb") as f:
-                f.write(content)
-            
-            return FileResponse(
-                path=local_file_path,
-                media_type="application/pdf",
-                filename=filename
-            )
+            byte_range = parse_range(request.headers.get("range"), stats.st_size)
+        except HTTPException:
+            f.close()
+            raise
+    start, end = byte_range or (0, stats.st_size - 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{stats.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    def body():
+        try:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                pdf_cache.served(len(block))
+                yield block
+        finally:
+            f.close()
+
+    return StreamingResponse(
+        body(), status_code=206 if byte_range else 200, media_type="application/pdf", headers=headers
+    )
+
+def fetch_pdf(key, dest):
+    tenant, filename = key.split("/", 1)
+    storage_client.download(storage_path(tenant, filename), dest)
+
+# Served PDFs that are not in a data directory; kept apart so they are never indexed
+pdf_cache = BlobCache(fetch_pdf)
+
+def open_pdf(tenant, filename):
+    """
+    Open the tenant's PDF: the copy in its data directory, else the cached copy, fetched from
+    Supabase on a miss. The cached file is opened in the same call that looks it up; if another
+    request's fetch evicted it in between, it is fetched again. Raises FileNotFoundError if the
+    PDF is in neither place.
+    """
+    try:
+        return open(tenant_dir(tenant) / filename, "rb")
+    except FileNotFoundError:
+        pass
+    key = f"{tenant}/{filename}"
+    for _ in range(2):
+        try:
+            cached_path = pdf_cache.get(key)
         except Exception as e:
-            raise HTTPException(status_code=404, detail=f"PDF not found: {filename}")
+            raise FileNotFoundError(f"PDF not found: {filename}") from e
+        try:
+            return open(cached_path, "rb")
+        except FileNotFoundError:
+            pdf_cache.discard(key)
+    raise FileNotFoundError(f"PDF evicted from the cache while opening it: {filename}")
+
+def serve_pdf(request, tenant, filename):
+    return pdf_response(request, open_pdf(tenant, filename), filename)
+
+@app.get("/pdfs/{filename}")
+async def get_pdf(filename: str, request: Request, tenant: str = None):
+    """
+    Get a specific PDF file by filename. Files not in the tenant's data directory are served
+    through the PDF cache, fetching them from Supabase on a miss. Supports Range and If-None-Match.
+    """
+    tenant = tenant_or_400(tenant)
+    if filename.startswith("."):
+        raise HTTPException(status_code=404, detail=f"PDF not found: {filename}")
+    try:
+        # From the local data directory, or else the PDF cache (downloaded from Supabase on a miss)
+        return await run_in_threadpool(serve_pdf, request, tenant, filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"PDF not found: {filename}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve PDF: {str(e)}")
 
 @app.post("/update-db/")
-async def update_db():
+async def update_db(full: bool = False, tenant: str = None):
     """
-    Update the vector database with current documents in the data directory
+    Update the tenant's vector database with current documents in its data directory.
+    Only new, modified and deleted files are touched unless `full=true` forces a rebuild.
+    Joins any index job already queued (e.g. by an upload) and waits for it to finish.
     """
+    tenant = tenant_or_400(tenant)
     try:
-        # Update the vector database
-        global vectordb
-        from mortgage_analysis import update_vector_db
-        vectordb = update_vector_db()
+        job_id = index_jobs.submit(tenant, full=full, reason="update-db")
+        job = await run_in_threadpool(index_jobs.wait, job_id)
+        if job["status"] == "failed":
+            raise RuntimeError(job["error"])
         
-        return {"message": "Vector database updated successfully"}
+        return {"message": "Vector database updated successfully", "index_job_id": job_id, "index": job["result"]}
     except Exception as e:
         print(f"Database update error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to update vector database: {str(e)}")
 
+@app.get("/index-jobs/{job_id}")
+async def get_index_job(job_id: str):
+    """
+    Report the status (queued, running, done or failed) of a background index job
+    """
+    job = index_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Index job not found: {job_id}")
+    return job
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
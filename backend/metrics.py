@@ -0,0 +1,207 @@
+"""
+Metrics and per-request traces for the RAG pipeline.
+
+`span(stage)` times one pipeline stage into the `rag_stage_seconds` histogram and, when a
+request ID is set, appends it to that request's trace (the last TRACE_REQUESTS requests
+are kept). The request ID lives in a context variable, so it follows the request through
+FastAPI's threadpool; work handed to other executors must go through `submit()` to keep it.
+`render()` writes every metric in the Prometheus text exposition format.
+"""
+import os
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+TRACE_REQUESTS = int(os.getenv("TRACE_REQUESTS", "200"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATIO_BUCKETS = (0.2, 0.4, 0.6, 0.8, 0.99, 1.0)
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+_registry = []
+
+
+def current_request_id():
+    return request_id_var.get()
+
+
+def submit(executor, fn, *args, **kwargs):
+    """`executor.submit`, running `fn` in a copy of the caller's context (and so under its request ID)."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry["buckets"]):
+                    samples.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), count))
+                samples.append((f"{self.name}_bucket", key, (("le", "+Inf"),), entry["count"]))
+                samples.append((f"{self.name}_sum", key, (), round(entry["sum"], 6)))
+                samples.append((f"{self.name}_count", key, (), entry["count"]))
+        return samples
+
+
+class Gauge(_Metric):
+    """A gauge read at scrape time: `collect()` returns {label values tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames=(), collect=dict):
+        super().__init__(name, help, labelnames)
+        self._collect = collect
+
+    def _samples(self):
+        try:
+            values = self._collect()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {str(e)}")
+            return []
+        return [(self.name, key, (), value) for key, value in sorted(values.items())]
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------
+# PIPELINE METRICS
+# -----------------------
+stage_seconds = Histogram("rag_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+stage_errors = Counter("rag_stage_errors_total", "Pipeline stages that raised", ["stage"])
+http_request_seconds = Histogram(
+    "rag_http_request_seconds", "HTTP request latency until the response starts", ["endpoint", "method", "status"]
+)
+llm_calls = Counter("rag_llm_calls_total", "LLM calls by purpose and outcome", ["purpose", "outcome"])
+llm_tokens = Counter("rag_llm_tokens_total", "LLM tokens by purpose and kind (prompt, completion)", ["purpose", "kind"])
+vote_rounds = Counter("rag_vote_rounds_total", "Voting rounds by outcome (majority, no_majority)", ["outcome"])
+vote_agreement = Histogram(
+    "rag_vote_agreement_ratio", "Share of a round's requested samples that gave the most common answer", buckets=RATIO_BUCKETS
+)
+verifications = Counter("rag_verifications_total", "Teacher verification branches taken", ["branch"])
+embedded_chunks = Counter("rag_embedded_chunks_total", "Chunks embedded and inserted into an index")
+
+
+# -----------------------
+# TRACES
+# -----------------------
+_traces = OrderedDict()   # request ID -> spans, oldest request first
+_traces_lock = threading.Lock()
+
+
+def record_span(stage: str, seconds: float, started_at: float = None, error: bool = False, **attributes):
+    """Record a stage timed elsewhere (e.g. in a worker process)."""
+    stage_seconds.observe(seconds, stage=stage)
+    if error:
+        stage_errors.inc(stage=stage)
+    request_id = request_id_var.get()
+    if request_id is None:
+        return
+    entry = {
+        "stage": stage,
+        "started_at": round(started_at if started_at is not None else time.time() - seconds, 6),
+        "seconds": round(seconds, 6),
+        "thread": threading.current_thread().name,
+        **({"error": True} if error else {}),
+        **attributes,
+    }
+    with _traces_lock:
+        spans = _traces.get(request_id)
+        if spans is None:
+            spans = _traces[request_id] = []
+            while len(_traces) > TRACE_REQUESTS:
+                _traces.popitem(last=False)
+        spans.append(entry)
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time the enclosed block as one `stage`. Attributes set on the yielded dict are kept in the trace."""
+    started_at = time.time()
+    started = time.perf_counter()
+    error = False
+    try:
+        yield attributes
+    except Exception:
+        error = True
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - started, started_at, error, **attributes)
+
+
+def trace(request_id: str):
+    """Spans recorded for `request_id`, in order of completion, or None if unknown or expired."""
+    with _traces_lock:
+        spans = _traces.get(request_id)
+        return [dict(entry) for entry in spans] if spans is not None else None
@@ -1,12 +1,21 @@
 import os
 import shutil
 import json
+import hashlib
 import re
+import time
+import threading
+import uuid
+import itertools
 from pathlib import Path
-from collections import Counter
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 
-import openai
+from llm_client import LLMClient, LLMError
+from audit_log import AuditLog
+import metrics
+from metrics import span
 
 # Load environment variables
 load_dotenv()
@@ -14,136 +23,579 @@ load_dotenv()
 # -----------------------
 # AZURE OPENAI CONFIGURATION
 # -----------------------
-openai.api_type = os.getenv("OPENAI_API_TYPE", "azure")
-openai.api_key = os.getenv("OPENAI_API_KEY", "")
-openai.api_base = os.getenv("OPENAI_API_BASE", "https://oai-ofcresearch-sandbox.openai.azure.com")
-openai.api_version = os.getenv("OPENAI_API_VERSION", "2024-12-01-preview")
+# Pooled, retrying, rate-limited client shared by every request (see llm_client.py)
+llm_client = LLMClient.from_env()
 
 # -----------------------
-# FOLDER SETUP FOR OUTPUTS
+# LLM CONCURRENCY SETTINGS
 # -----------------------
-PARALLEL_JSON_DIR = "parallel_json_outputs"
-AGREED_JSON_DIR = "agreed_json_outputs"
+VOTE_SAMPLES = 5
+VOTE_QUORUM = 3
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "10"))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "60"))
+# parallel: every vote sample is requested at once. staged: `quorum` first, more only while needed (fewer tokens, more latency)
+VOTE_SAMPLING = os.getenv("VOTE_SAMPLING", "parallel")
+if VOTE_SAMPLING not in ("parallel", "staged"):
+    raise ValueError(f"Unknown VOTE_SAMPLING '{VOTE_SAMPLING}'. Expected parallel or staged")
 
-os.makedirs(PARALLEL_JSON_DIR, exist_ok=True)
-os.makedirs(AGREED_JSON_DIR, exist_ok=True)
+# Shared by every request so the total number of in-flight LLM calls stays bounded
+llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+
+# -----------------------
+# AUDIT LOG OF SAMPLED AND VERIFIED ANSWERS
+# -----------------------
+# Written by a background thread (see audit_log.py), one JSON line per attempt/verification
+audit_log = AuditLog()
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def request_id_for(stats: dict) -> str:
+    """The request ID this work is traced under (the HTTP request's, when there is one), recorded in `stats`."""
+    return stats.setdefault("request_id", metrics.current_request_id() or new_request_id())
 
 # -----------------------
 # DOCUMENT LOADING & VECTOR DATABASE SETUP
 # -----------------------
-from langchain_community.document_loaders import DirectoryLoader
-from langchain_community.document_loaders.pdf import PyPDFDirectoryLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 
+from ingestion import file_fingerprint, ingest
+from embedding_cache import CachedEmbeddings
+from keyword_index import BM25Index, reciprocal_rank_fusion
+from token_budget import count_tokens, fit_excerpts, fit_outputs, TokenLedger, MAX_PROMPT_TOKENS
+
 DATA_PATH = os.path.abspath("data")
 CHROMA_PATH = "chroma_db"
+MANIFEST_FILENAME = "manifest.json"
+KEYWORD_INDEX_FILENAME = "keyword_index.json"
+INDEXED_EXTENSIONS = (".pdf", ".md")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 
-def load_documents():
-    all_docs = []
-    file_counts = {"md_files": set(), "pdf_files": set()}
-    try:
-        md_loader = DirectoryLoader(
-            DATA_PATH,
-            glob="**/*.md",
-            recursive=True,
-            show_progress=False,
-            loader_kwargs={"autodetect_encoding": True}
-        )
-        md_docs = md_loader.load()
-        file_counts["md_files"] = {doc.metadata['source'] for doc in md_docs}
-        all_docs.extend(md_docs)
-    except Exception as e:
-        print(f"Error loading Markdown files: {str(e)}")
+# The default tenant keeps the original data/ and chroma_db/ layout; every other tenant
+# gets its own TENANTS_PATH/<tenant>/data and TENANTS_PATH/<tenant>/chroma_db
+DEFAULT_TENANT = "default"
+TENANTS_PATH = os.getenv("TENANTS_PATH", "tenants")
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def validate_tenant(tenant):
+    tenant = tenant or DEFAULT_TENANT
+    if not TENANT_ID_PATTERN.match(tenant):
+        raise ValueError(f"Invalid tenant '{tenant}': use 1-64 letters, digits, '-' or '_'")
+    return tenant
+
+def tenant_data_path(tenant):
+    tenant = validate_tenant(tenant)
+    if tenant == DEFAULT_TENANT:
+        return DATA_PATH
+    return os.path.abspath(os.path.join(TENANTS_PATH, tenant, "data"))
+
+def tenant_chroma_path(tenant):
+    tenant = validate_tenant(tenant)
+    if tenant == DEFAULT_TENANT:
+        return CHROMA_PATH
+    return os.path.join(TENANTS_PATH, tenant, "chroma_db")
+
+# -----------------------
+# SHARED EMBEDDING MODEL
+# -----------------------
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings():
+    """
+    Process-wide embedding model, loaded once on first use. Document embeddings go through
+    a persistent cache keyed on chunk text, so unchanged chunks are never re-embedded.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                started = time.perf_counter()
+                _embeddings = CachedEmbeddings(
+                    HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME), EMBEDDING_MODEL_NAME
+                )
+                print(f"\n🧠 Embedding model '{EMBEDDING_MODEL_NAME}' loaded in {time.perf_counter() - started:.2f}s")
+    return _embeddings
+
+def embeddings_loaded():
+    return _embeddings is not None
+
+def warm_up_embeddings():
+    # The first encode call also pays for tokenizer and kernel initialisation
+    get_embeddings().embed_query("mortgage interest rate")
+
+# Generations are unique across tenants and rebuilds, so a memo can never match a different index
+_generation_counter = itertools.count(1)
+
+class KnowledgeBase:
+    """
+    One tenant's documents and one version of its Chroma collection and keyword index,
+    stored in `chroma_path/<version>`. `generation` changes on every index mutation so
+    results derived from the old index can be dropped.
+    """
+    def __init__(self, tenant=DEFAULT_TENANT, version=None):
+        self.tenant = validate_tenant(tenant)
+        self.data_path = tenant_data_path(self.tenant)
+        self.chroma_path = tenant_chroma_path(self.tenant)
+        if self.tenant == DEFAULT_TENANT:
+            self.summary_cache_path = SUMMARY_CACHE_FILE
+        else:
+            self.summary_cache_path = os.path.join(TENANTS_PATH, self.tenant, SUMMARY_CACHE_FILE)
+        self.version = version or read_current_version(self.chroma_path)
+        self.index_path = os.path.join(self.chroma_path, self.version)
+        self.vectordb = None
+        # BM25 index over the same chunks as the Chroma collection, kept in step by index_files/remove_files_from_index
+        self.keyword_index = BM25Index()
+        self.generation = next(_generation_counter)
+        self._readers = 0
+        self.retired = False
+
+    def bump_generation(self):
+        self.generation = next(_generation_counter)
+        answer_cache.invalidate(self.tenant)
+
+    def acquire(self):
+        """Register a reader, so this version is not collected while it is being queried."""
+        with _version_lock:
+            _version_readers[(self.chroma_path, self.version)] += 1
+            self._readers += 1
+
+    def release(self):
+        with _version_lock:
+            key = (self.chroma_path, self.version)
+            _version_readers[key] -= 1
+            last_reader = _version_readers[key] <= 0
+            if last_reader:
+                del _version_readers[key]
+            self._readers -= 1
+            close = self.retired and self._readers <= 0
+        if close:
+            self.close()
+        if last_reader:
+            collect_index_versions(self.chroma_path)
+
+    def retire(self):
+        """No new readers will get this knowledge base (e.g. evicted or replaced); close it once the last one is done."""
+        with _version_lock:
+            self.retired = True
+            close = self._readers <= 0
+        if close:
+            self.close()
+
+    def close(self):
+        """Drop the Chroma collection, stopping chromadb's system for the index once no open knowledge base uses it."""
+        with _version_lock:
+            if self.vectordb is None:
+                return
+            self.vectordb = None
+            _open_systems[self.index_path] -= 1
+            last = _open_systems[self.index_path] <= 0
+            if last:
+                del _open_systems[self.index_path]
+        self.keyword_index = BM25Index()
+        if last:
+            stop_chroma_system(self.index_path)
+
+# -----------------------
+# INDEX VERSIONS
+# -----------------------
+# Every full build goes into a new chroma_path/<version> directory. CURRENT names the live
+# version and is switched atomically once a build completes; older versions are deleted
+# once no reader holds them. One writer per tenant at a time.
+CURRENT_VERSION_FILENAME = "CURRENT"
+LEGACY_VERSION = "v0"
+
+_version_lock = threading.Lock()
+_version_readers = Counter()   # (chroma_path, version) -> active readers
+_open_systems = Counter()      # index_path -> knowledge bases with its Chroma collection open
+_writer_locks = {}
+
+def writer_lock(tenant):
+    with _version_lock:
+        return _writer_locks.setdefault(tenant, threading.Lock())
+
+def new_index_version():
+    return f"v{time.time_ns()}"
+
+def read_current_version(chroma_path):
     try:
-        pdf_loader = PyPDFDirectoryLoader(
-            DATA_PATH,
-            glob="**/*.pdf",
-            recursive=True,
-        )
-        pdf_docs = pdf_loader.load()
-        file_counts["pdf_files"] = {doc.metadata['source'] for doc in pdf_docs}
-        all_docs.extend(pdf_docs)
-    except Exception as e:
-        print(f"Error loading PDF files: {str(e)}")
-    print(f"\n📂 Document Discovery in '{os.path.relpath(DATA_PATH)}':")
-    print(f"• Markdown files: {len(file_counts['md_files'])}")
-    print(f"• PDF documents: {len(file_counts['pdf_files'])}")
-    print(f"• Total chunks: {len(all_docs)}")
-    if not all_docs:
-        raise ValueError("❗ No documents found in directory structure")
-    return all_docs
-
-def split_documents(docs):
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-        is_separator_regex=False,
+        with open(os.path.join(chroma_path, CURRENT_VERSION_FILENAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def write_current_version(chroma_path, version):
+    os.makedirs(chroma_path, exist_ok=True)
+    current_path = os.path.join(chroma_path, CURRENT_VERSION_FILENAME)
+    tmp_path = current_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, current_path)
+
+def migrate_legacy_index(chroma_path):
+    """Move an index built before versioning (files directly in chroma_path) into LEGACY_VERSION."""
+    if not os.path.isdir(chroma_path) or read_current_version(chroma_path) is not None:
+        return
+    entries = os.listdir(chroma_path)
+    if not entries:
+        return
+    legacy_path = os.path.join(chroma_path, LEGACY_VERSION)
+    os.makedirs(legacy_path, exist_ok=True)
+    for entry in entries:
+        if entry != LEGACY_VERSION:
+            os.replace(os.path.join(chroma_path, entry), os.path.join(legacy_path, entry))
+    write_current_version(chroma_path, LEGACY_VERSION)
+    print(f"📦 Moved existing index in '{chroma_path}' to version {LEGACY_VERSION}")
+
+def index_versions(chroma_path):
+    if not os.path.isdir(chroma_path):
+        return []
+    return sorted(
+        entry for entry in os.listdir(chroma_path)
+        if entry.startswith("v") and os.path.isdir(os.path.join(chroma_path, entry))
     )
-    return text_splitter.split_documents(docs)
 
-def create_vector_db():
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    if not os.path.exists(CHROMA_PATH):
-        print("\n🛠️ Building mortgage knowledge base...")
+def version_order(version):
+    return int(version[1:]) if version[1:].isdigit() else -1
+
+def stop_chroma_system(index_path):
+    """
+    chromadb keeps one client system (SQLite connections, HNSW segments in memory) per persist
+    directory for the life of the process, even once every client for it is gone; stop it.
+    """
+    try:
+        from chromadb.api.client import SharedSystemClient
+    except ImportError:
+        return
+    # (sic) chromadb's own attribute name
+    system = getattr(SharedSystemClient, "_identifer_to_system", {}).pop(index_path, None)
+    if system is not None:
         try:
-            docs = load_documents()
-            split_docs = split_documents(docs)
-            vectordb = Chroma.from_documents(
-                documents=split_docs,
-                embedding=embeddings,
-                persist_directory=CHROMA_PATH,
-                collection_metadata={"hnsw:space": "cosine"}
-            )
-            # vectordb.persist()
-            print(f"\n✅ Knowledge base created with {len(split_docs)} vectorized chunks")
-        except ValueError as e:
-            print(f"\n❌ Critical error: {str(e)}")
-            exit(1)
+            system.stop()
         except Exception as e:
-            print(f"Error creating database: {str(e)}")
-            exit(1)
-    else:
-        print("\n📚 Loading existing mortgage knowledge base...\n")
-        vectordb = Chroma(
-            persist_directory=CHROMA_PATH,
-            embedding_function=embeddings
-        )
-    return vectordb
-
-def update_vector_db():
-    print("\n🧹 Clearing existing mortgage knowledge base...")
-    shutil.rmtree(CHROMA_PATH, ignore_errors=True)
-    print("\n🛠️ Building updated mortgage knowledge base...")
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    docs = load_documents()
-    split_docs = split_documents(docs)
-    vectordb = Chroma.from_documents(
-        documents=split_docs,
-        embedding=embeddings,
-        persist_directory=CHROMA_PATH,
+            print(f"Error stopping Chroma system for '{index_path}': {str(e)}")
+
+def collect_index_versions(chroma_path):
+    """
+    Delete versions older than CURRENT that no reader holds. Newer ones may be builds in
+    progress and are left alone.
+    """
+    current = read_current_version(chroma_path)
+    if current is None:
+        return
+    with _version_lock:
+        stale = [
+            version for version in index_versions(chroma_path)
+            if version_order(version) < version_order(current) and not _version_readers[(chroma_path, version)]
+        ]
+        for version in stale:
+            _version_readers.pop((chroma_path, version), None)
+    for version in stale:
+        stop_chroma_system(os.path.join(chroma_path, version))
+        shutil.rmtree(os.path.join(chroma_path, version), ignore_errors=True)
+        print(f"🗑️ Removed index version {version} from '{chroma_path}'")
+
+def discover_files(kb):
+    """Return the absolute paths of every indexable file under the tenant's data directory."""
+    found = []
+    for ext in INDEXED_EXTENSIONS:
+        found.extend(str(p.resolve()) for p in Path(kb.data_path).glob(f"**/*{ext}") if p.is_file())
+    return sorted(found)
+
+# -----------------------
+# INDEX MANIFEST (one entry per indexed file)
+# -----------------------
+def load_manifest(kb):
+    return read_manifest(kb.index_path)
+
+def current_manifest(tenant):
+    """The manifest of the tenant's current index version, read without opening the index."""
+    chroma_path = tenant_chroma_path(tenant)
+    version = read_current_version(chroma_path)
+    return read_manifest(os.path.join(chroma_path, version)) if version else {}
+
+def read_manifest(index_path):
+    manifest_path = os.path.join(index_path, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading index manifest, treating index as empty: {str(e)}")
+        return {}
+
+def save_manifest(kb, manifest):
+    os.makedirs(kb.index_path, exist_ok=True)
+    manifest_path = os.path.join(kb.index_path, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with span("index_save", tenant=kb.tenant, files=len(manifest)):
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+        # The keyword index always describes the same chunks as the manifest
+        kb.keyword_index.save(os.path.join(kb.index_path, KEYWORD_INDEX_FILENAME))
+
+def indexed_chunk_count(kb):
+    return sum(entry.get("chunks", 0) for entry in load_manifest(kb).values())
+
+def diff_manifest(kb, manifest):
+    """
+    Compare the files in the tenant's data directory with the manifest.
+    Returns (changed, removed): files that need (re)indexing and files whose chunks must be dropped.
+    """
+    current = discover_files(kb)
+    changed = []
+    for path in current:
+        entry = manifest.get(path)
+        if entry is None:
+            changed.append(path)
+            continue
+        stats = os.stat(path)
+        if entry["size"] == stats.st_size and entry["mtime"] == stats.st_mtime:
+            continue
+        # Size or mtime moved; only re-embed when the bytes actually differ
+        fingerprint = file_fingerprint(path)
+        if fingerprint["sha256"] != entry["sha256"]:
+            changed.append(path)
+        else:
+            entry.update(fingerprint)
+    removed = sorted(set(manifest) - set(current))
+    return changed, removed
+
+# -----------------------
+# INCREMENTAL INDEX OPERATIONS
+# -----------------------
+def open_vector_db(kb):
+    vectordb = Chroma(
+        persist_directory=kb.index_path,
+        embedding_function=get_embeddings(),
         collection_metadata={"hnsw:space": "cosine"}
     )
-    # vectordb.persist()
-    print(f"\n✅ Mortgage knowledge base updated with {len(split_docs)} vectorized chunks")
-    return vectordb
+    with _version_lock:
+        if kb.vectordb is None:
+            _open_systems[kb.index_path] += 1
+        kb.vectordb = vectordb
+    load_keyword_index(kb)
+    return kb
+
+def load_keyword_index(kb):
+    """Load the persisted keyword index, or rebuild it from the collection for indexes created without one."""
+    index_path = os.path.join(kb.index_path, KEYWORD_INDEX_FILENAME)
+    if os.path.exists(index_path):
+        try:
+            kb.keyword_index = BM25Index.load(index_path)
+            return
+        except Exception as e:
+            print(f"Error reading keyword index, rebuilding it: {str(e)}")
+    kb.keyword_index = BM25Index()
+    contents = kb.vectordb.get(include=["documents", "metadatas"])
+    for chunk_id, text, metadata in zip(contents["ids"], contents["documents"], contents["metadatas"]):
+        kb.keyword_index.add(chunk_id, text, (metadata or {}).get("source", ""))
+    if contents["ids"]:
+        os.makedirs(kb.index_path, exist_ok=True)
+        kb.keyword_index.save(index_path)
+    print(f"🔤 Keyword index rebuilt with {len(kb.keyword_index)} chunks")
+
+def remove_files_from_index(kb, paths, manifest=None):
+    """Drop every chunk whose `source` metadata matches one of `paths`."""
+    save = manifest is None
+    if manifest is None:
+        manifest = load_manifest(kb)
+    removed_chunks = 0
+    for path in paths:
+        path = os.path.abspath(path)
+        ids = kb.vectordb.get(where={"source": path}, include=[])["ids"]
+        if ids:
+            with span("index_delete", tenant=kb.tenant, chunks=len(ids)):
+                kb.vectordb.delete(ids=ids)
+        kb.keyword_index.remove_source(path)
+        removed_chunks += len(ids)
+        manifest.pop(path, None)
+    if removed_chunks:
+        kb.bump_generation()
+    if save:
+        save_manifest(kb, manifest)
+    return removed_chunks
+
+def index_files(kb, paths, manifest=None):
+    """
+    Embed and insert only the chunks of `paths`, replacing any chunks previously indexed for them.
+    Files that fail to parse are logged and skipped (and left out of the manifest so the next sync retries them).
+    """
+    save = manifest is None
+    if manifest is None:
+        manifest = load_manifest(kb)
+    paths = [os.path.abspath(p) for p in paths]
+
+    def on_file(parsed):
+        remove_files_from_index(kb, [parsed["path"]], manifest)
+        for chunk_id, text, _ in parsed["chunks"]:
+            kb.keyword_index.add(chunk_id, text, parsed["path"])
+        manifest[parsed["path"]] = {**parsed["fingerprint"], "chunks": len(parsed["chunks"])}
+
+    def on_error(path, error):
+        print(f"⚠️ Skipping {os.path.relpath(path)}: {error}")
+        remove_files_from_index(kb, [path], manifest)
+
+    added_chunks = ingest(kb.vectordb, paths, on_file, on_error)
+    if paths:
+        kb.bump_generation()
+    if save:
+        save_manifest(kb, manifest)
+    return added_chunks
+
+def sync_vector_db(kb):
+    """
+    Bring the tenant's index in line with its data directory by embedding only new or
+    modified files and dropping chunks of deleted ones. Small changes are applied to the
+    live version in place; queries keep running against it meanwhile.
+    """
+    with writer_lock(kb.tenant):
+        if kb.vectordb is None:
+            open_vector_db(kb)
+        manifest = load_manifest(kb)
+        changed, removed = diff_manifest(kb, manifest)
+        removed_chunks = remove_files_from_index(kb, removed, manifest)
+        added_chunks = index_files(kb, changed, manifest)
+        save_manifest(kb, manifest)
+    print(f"\n🔁 Incremental index sync ({kb.tenant}): {len(changed)} file(s) indexed ({added_chunks} chunks), "
+          f"{len(removed)} file(s) removed ({removed_chunks} chunks)")
+    return kb, {
+        "indexed": [os.path.basename(p) for p in changed],
+        "removed": [os.path.basename(p) for p in removed],
+        "chunks_added": added_chunks,
+        "chunks_removed": removed_chunks,
+    }
+
+def build_vector_db(kb):
+    files = discover_files(kb)
+    print(f"\n📂 Document Discovery in '{os.path.relpath(kb.data_path)}':")
+    print(f"• Markdown files: {sum(1 for p in files if p.lower().endswith('.md'))}")
+    print(f"• PDF documents: {sum(1 for p in files if p.lower().endswith('.pdf'))}")
+    if not files:
+        print("⚠️ No documents found in directory structure; starting with an empty knowledge base")
+    open_vector_db(kb)
+    manifest = {}
+    total_chunks = index_files(kb, files, manifest)
+    save_manifest(kb, manifest)
+    return kb, total_chunks
+
+def create_vector_db(tenant=DEFAULT_TENANT):
+    """Open the tenant's current index version, building the first one if there is none."""
+    tenant = validate_tenant(tenant)
+    chroma_path = tenant_chroma_path(tenant)
+    with writer_lock(tenant):
+        migrate_legacy_index(chroma_path)
+        version = read_current_version(chroma_path)
+        if version is None:
+            print(f"\n🛠️ Building mortgage knowledge base ({tenant})...")
+            kb = KnowledgeBase(tenant, new_index_version())
+            try:
+                kb, total_chunks = build_vector_db(kb)
+            except Exception as e:
+                print(f"\n❌ Error creating database: {str(e)}")
+                kb.close()
+                shutil.rmtree(kb.index_path, ignore_errors=True)
+                raise
+            write_current_version(chroma_path, kb.version)
+            print(f"\n✅ Knowledge base created with {total_chunks} vectorized chunks")
+        else:
+            print(f"\n📚 Loading existing mortgage knowledge base ({tenant}, {version})...\n")
+            kb = KnowledgeBase(tenant, version)
+            open_vector_db(kb)
+    # Leftovers of earlier rebuilds; nothing in this process can be reading them yet
+    collect_index_versions(chroma_path)
+    return kb
+
+def update_vector_db(tenant=DEFAULT_TENANT):
+    """
+    Full rebuild into a new index version, made current only once it is complete. Queries keep
+    using the previous version meanwhile; call collect_index_versions() once they have switched
+    over. Prefer sync_vector_db() unless the index itself is suspect.
+    """
+    tenant = validate_tenant(tenant)
+    with writer_lock(tenant):
+        kb = KnowledgeBase(tenant, new_index_version())
+        print(f"\n🛠️ Building mortgage knowledge base version {kb.version} ({tenant})...")
+        try:
+            kb, total_chunks = build_vector_db(kb)
+        except Exception:
+            kb.close()
+            shutil.rmtree(kb.index_path, ignore_errors=True)
+            raise
+        write_current_version(kb.chroma_path, kb.version)
+        kb.bump_generation()
+    print(f"\n✅ Mortgage knowledge base updated with {total_chunks} vectorized chunks")
+    return kb
 
 # -----------------------
 # BASIC API CALL & NORMALIZATION
 # -----------------------
-def query_openai(prompt: str) -> str:
+# Tokens spent per purpose (vote, teacher, fast), reported by GET /token-stats/
+token_ledger = TokenLedger()
+
+def check_prompt_size(prompt: str, purpose: str) -> int:
+    prompt_tokens = count_tokens(prompt)
+    if prompt_tokens > MAX_PROMPT_TOKENS:
+        print(f"⚠️ {purpose} prompt is {prompt_tokens} tokens, above MAX_PROMPT_TOKENS={MAX_PROMPT_TOKENS}")
+    return prompt_tokens
+
+def record_tokens(purpose: str, prompt_tokens: int, completion_tokens: int, usage: dict = None):
+    token_ledger.record(purpose, prompt_tokens, completion_tokens)
+    metrics.llm_tokens.inc(prompt_tokens, purpose=purpose, kind="prompt")
+    metrics.llm_tokens.inc(completion_tokens, purpose=purpose, kind="completion")
+    print(f"🧮 {purpose} call: {prompt_tokens} prompt + {completion_tokens} completion tokens")
+    if usage is not None:
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + prompt_tokens
+        usage["completion_tokens"] = usage.get("completion_tokens", 0) + completion_tokens
+
+def query_openai(prompt: str, usage: dict = None, purpose: str = "answer") -> str:
+    """
+    `usage`, if given, accumulates the prompt/completion token counts reported by the API.
+    Raises LLMError once the client has given up retrying.
+    """
+    prompt_tokens = check_prompt_size(prompt, purpose)
+    reported = {}
     try:
-        response = openai.ChatCompletion.create(
-            engine="gpt-4o-mini",  # Replace with your deployed engine name
-            # engine="o3-mini",  # Use the OpenAI engine name
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1  # Lower temperature for consistency # for GPT-4o
-        )
-        return response.choices[0].message['content']
-    except Exception as e:
-        return f"Error querying OpenAI: {str(e)}"
+        with span(f"llm.{purpose}", prompt_tokens=prompt_tokens):
+            answer = llm_client.chat(prompt, temperature=0.1, usage=reported)  # Lower temperature for consistency
+    except LLMError:
+        metrics.llm_calls.inc(purpose=purpose, outcome="error")
+        raise
+    metrics.llm_calls.inc(purpose=purpose, outcome="ok")
+    record_tokens(
+        purpose,
+        reported.get("prompt_tokens", prompt_tokens),
+        reported.get("completion_tokens", count_tokens(answer)),
+        usage,
+    )
+    return answer
+
+def stream_openai(prompt: str, usage: dict = None, purpose: str = "answer"):
+    """
+    Yield the completion for `prompt` piece by piece as the model produces it. Raises LLMError on failure.
+    The stream carries no usage report, so its token counts are our own estimates.
+    """
+    prompt_tokens = check_prompt_size(prompt, purpose)
+    pieces = []
+    try:
+        with span(f"llm.{purpose}", prompt_tokens=prompt_tokens, streamed=True):
+            for token in llm_client.stream_chat(prompt, temperature=0.1):
+                pieces.append(token)
+                yield token
+    except LLMError:
+        metrics.llm_calls.inc(purpose=purpose, outcome="error")
+        raise
+    metrics.llm_calls.inc(purpose=purpose, outcome="ok")
+    record_tokens(purpose, prompt_tokens, count_tokens("".join(pieces)), usage)
+
+def notify(on_event, event: str, **data):
+    """Report pipeline progress to an optional `on_event(event, data)` listener (used for streaming)."""
+    if on_event is not None:
+        on_event(event, data)
 
 def normalize_response(response: str) -> str:
     # Remove markdown code block markers if present
@@ -162,11 +614,135 @@ def normalize_response(response: str) -> str:
     except Exception:
         return cleaned.lower().strip()
 
+def collect_votes(prompt: str, n: int = VOTE_SAMPLES, quorum: int = VOTE_QUORUM, on_event=None, usage: dict = None,
+                  seed_outputs=(), full_round: bool = False):
+    """
+    Sample up to `n` answers and count normalized answers as they arrive. All `n` calls go out at
+    once (one call's latency per round); with VOTE_SAMPLING=staged only `quorum` go out first and
+    more are added only when the outstanding calls could not reach the quorum on their own, which
+    saves tokens when rounds agree but adds round trips when they do not.
+    Stops as soon as `quorum` answers agree, or once no answer can still reach the quorum,
+    and cancels the calls that have not started yet. With `full_round`, a reached quorum does not
+    stop the round: every sample is collected, so agreement beyond the quorum (unanimity) is seen.
+    Failed calls are dropped, never counted as votes.
+    `usage`, if given, accumulates the token counts of the samples received.
+    `seed_outputs` are answers already sampled for this prompt (e.g. an adaptive check); they
+    count as votes and as part of the `n` samples, and are not included in `calls_used`.
+    Returns (outputs, majority_response or None, calls_used).
+    """
+    with span("vote", samples=n, quorum=quorum, seeded=len(seed_outputs)) as attributes:
+        outputs, majority_response, calls_used = _collect_votes(
+            prompt, n, quorum, on_event, usage, seed_outputs, full_round
+        )
+        attributes.update(received=len(outputs), majority=majority_response is not None, calls_used=calls_used)
+    metrics.vote_rounds.inc(outcome="majority" if majority_response is not None else "no_majority")
+    if outputs:
+        top_count = Counter(normalize_response(o) for o in outputs).most_common(1)[0][1]
+        metrics.vote_agreement.observe(top_count / n)
+    return outputs, majority_response, calls_used
+
+def _collect_votes(prompt, n, quorum, on_event, usage, seed_outputs=(), full_round=False):
+    # One usage dict per call, merged here, so worker threads never update a shared dict
+    futures = {}
+    pending = set()
+    outputs = list(seed_outputs)[:n]
+    freq = Counter(normalize_response(o) for o in outputs)
+    majority_response = next((o for o in outputs if freq[normalize_response(o)] >= quorum), None)
+    # Samples that may still be requested
+    budget = n - len(outputs)
+    deadline = None
+    while True:
+        top_count = freq.most_common(1)[0][1] if freq else 0
+        if (majority_response is not None and not full_round) or top_count + len(pending) + budget - len(futures) < quorum:
+            break
+        if VOTE_SAMPLING == "staged" and not full_round:
+            # Just enough calls that the outstanding ones could still complete the quorum
+            launch = min(quorum - top_count - len(pending), budget - len(futures))
+        else:
+            launch = budget - len(futures)
+        for _ in range(launch):
+            call_usage = {}
+            future = metrics.submit(llm_executor, query_openai, prompt, call_usage, "vote")
+            futures[future] = call_usage
+            pending.add(future)
+            # Calls queued behind other requests get one extra timeout window before we give up on them
+            deadline = time.monotonic() + 2 * LLM_CALL_TIMEOUT
+        if not pending:
+            break
+        done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            print(f"⚠️ {len(pending)} LLM call(s) timed out")
+            break
+        for future in done:
+            try:
+                output = future.result()
+            except LLMError as e:
+                print(f"⚠️ LLM sample failed: {str(e)}")
+                continue
+            if usage is not None:
+                for key, value in futures[future].items():
+                    usage[key] = usage.get(key, 0) + value
+            outputs.append(output)
+            normalized = normalize_response(output)
+            freq[normalized] += 1
+            notify(on_event, "vote", received=len(outputs), of=n, top_count=freq.most_common(1)[0][1])
+            if freq[normalized] >= quorum and majority_response is None:
+                majority_response = output
+    # Calls already running cannot be interrupted, so they still count as used
+    cancelled = sum(1 for future in pending if future.cancel())
+    return outputs, majority_response, len(futures) - cancelled
+
 # -----------------------
 # SMART TEACHER VERIFICATION LAYER
 # -----------------------
-def verify_interactive_outputs(query: str, context_text: str, source_info: str, outputs: list) -> str:
-    outputs_text = "\n\n".join([f"Output {i+1}:\n{o}" for i, o in enumerate(outputs)])
+# always: verify every majority. skip-unanimous: trust a majority when every sample agreed.
+# skip-agreement: trust it when at least VERIFY_AGREEMENT_THRESHOLD of the samples agreed.
+# Under these two, voting rounds collect every sample instead of stopping at the quorum, and agreement
+# counts the samples requested, so failed samples are never mistaken for agreement.
+# diff: verify with a compact prompt listing each distinct answer once.
+VERIFY_POLICIES = ("always", "skip-unanimous", "skip-agreement", "diff")
+VERIFY_POLICY = os.getenv("VERIFY_POLICY", "always")
+VERIFY_AGREEMENT_THRESHOLD = float(os.getenv("VERIFY_AGREEMENT_THRESHOLD", "0.8"))
+if VERIFY_POLICY not in VERIFY_POLICIES:
+    raise ValueError(f"Unknown VERIFY_POLICY '{VERIFY_POLICY}'. Expected one of: {', '.join(VERIFY_POLICIES)}")
+
+# How often each verification branch fires and what it costs
+VERIFICATION_BRANCHES = ("teacher", "diff", "skipped_unanimous", "skipped_agreement", "final_teacher")
+verification_stats = {
+    branch: {"count": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+    for branch in VERIFICATION_BRANCHES
+}
+_verification_lock = threading.Lock()
+
+def record_verification(branch: str, started: float, usage: dict):
+    metrics.verifications.inc(branch=branch)
+    with _verification_lock:
+        entry = verification_stats[branch]
+        entry["count"] += 1
+        entry["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        entry["completion_tokens"] += usage.get("completion_tokens", 0)
+        entry["seconds"] = round(entry["seconds"] + time.perf_counter() - started, 3)
+
+def get_verification_stats():
+    with _verification_lock:
+        return {branch: dict(entry) for branch, entry in verification_stats.items()}
+
+def ask_teacher(prompt: str, on_token=None, usage: dict = None) -> str:
+    with span("teacher", streamed=on_token is not None):
+        if on_token is None:
+            return query_openai(prompt, usage, "teacher")
+        tokens = []
+        for token in stream_openai(prompt, usage, "teacher"):
+            tokens.append(token)
+            on_token(token)
+        return "".join(tokens)
+
+def verify_interactive_outputs(query: str, context_text: str, source_info: str, outputs: list, on_token=None, usage: dict = None) -> str:
+    # Identical answers are listed once with their count, and the list is trimmed to OUTPUTS_TOKEN_BUDGET
+    outputs_text = "\n\n".join(
+        f"Output {i+1} (given by {count} of {len(outputs)} samples):\n{o}"
+        for i, (o, count) in enumerate(fit_outputs(outputs, normalize_response))
+    )
     prompt = f"""```text
 You are a knowledgeable teacher in mortgage analysis (specializing in USA & Canada). A user asked:
 "{query}"
@@ -184,59 +760,131 @@ Review these answers carefully. A majority answer has been found among these out
 
 Return only the final unified answer in plain text.
 ```"""
-    teacher_response = query_openai(prompt)
-    return teacher_response
+    return ask_teacher(prompt, on_token, usage)
+
+def verify_answer_diff(query: str, context_text: str, outputs: list, on_token=None, usage: dict = None) -> str:
+    """Compact verification: each distinct answer appears once with its vote count, instead of every output."""
+    candidates_text = "\n\n".join(
+        f"Candidate {i+1} ({count} of {len(outputs)} votes):\n{output}"
+        for i, (output, count) in enumerate(fit_outputs(outputs, normalize_response))
+    )
+    prompt = f"""```text
+You are a knowledgeable teacher in mortgage analysis (specializing in USA & Canada). A user asked:
+"{query}"
+
+The document context provided is:
+{context_text}
+
+Candidate answers:
+{candidates_text}
+
+Choose the candidate best supported by the document context, correcting it only if it contradicts the context.
+
+Return only the final answer in plain text.
+```"""
+    return ask_teacher(prompt, on_token, usage)
+
+def verification_branch(outputs: list, samples: int) -> str:
+    """
+    Pick how to verify a majority under VERIFY_POLICY, based on how strongly the samples agree.
+    Agreement is measured against the `samples` requested, not the outputs received: failed calls
+    are dropped, so a few agreeing outputs are not unanimity.
+    """
+    agreement = Counter(normalize_response(o) for o in outputs).most_common(1)[0][1] / samples
+    if VERIFY_POLICY in ("skip-unanimous", "skip-agreement") and agreement == 1:
+        return "skipped_unanimous"
+    if VERIFY_POLICY == "skip-agreement" and agreement >= VERIFY_AGREEMENT_THRESHOLD:
+        return "skipped_agreement"
+    if VERIFY_POLICY == "diff":
+        return "diff"
+    return "teacher"
 
 # -----------------------
 # 5-PARALLEL INTERACTIVE QUERY
 # -----------------------
-def parallel_interactive_query(prompt: str, query: str, context_text: str, source_info: str, max_attempts: int = 3) -> str:
+def parallel_interactive_query(prompt: str, query: str, context_text: str, source_info: str, max_attempts: int = 3, stats: dict = None, on_event=None, samples: int = VOTE_SAMPLES, quorum: int = VOTE_QUORUM, seed_outputs=()) -> str:
+    if stats is None:
+        stats = {}
+    stats.setdefault("llm_calls", 0)
+    request_id = request_id_for(stats)
+    # With a listener attached, the teacher's answer is streamed token by token
+    on_token = (lambda token: notify(on_event, "token", text=token)) if on_event else None
     all_attempts_outputs = []  # Collect outputs from all attempts
     for attempt in range(max_attempts):
-        outputs = []
-        for i in range(5):
-            out = query_openai(prompt)
-            outputs.append(out)
-        # Save outputs for this attempt and accumulate overall outputs
+        notify(on_event, "attempt", attempt=attempt + 1)
+        started = time.perf_counter()
+        usage = {}
+        # Answers sampled before voting started count towards the first attempt only
+        seed = seed_outputs if attempt == 0 else ()
+        # Skip policies judge how many of the samples agree, so they need the whole round, not just a quorum
+        full_round = VERIFY_POLICY in ("skip-unanimous", "skip-agreement")
+        outputs, majority_response, calls_used = collect_votes(
+            prompt, samples, quorum, on_event, usage, seed, full_round=full_round
+        )
+        stats["llm_calls"] += calls_used
+        stats["attempts"] = attempt + 1
         all_attempts_outputs.extend(outputs)
-        par_filename = os.path.join(PARALLEL_JSON_DIR, f"parallel_interactive_attempt_{attempt+1}.json")
-        with open(par_filename, "w") as f:
-            json.dump({"outputs": outputs}, f, indent=2)
-        print(f"🔄 Parallel interactive outputs saved to {par_filename}")
+        audit_log.record(
+            "attempt", request_id, attempt=attempt + 1, outputs=outputs, calls_used=calls_used,
+            majority=majority_response is not None, seconds=round(time.perf_counter() - started, 3), tokens=usage
+        )
         
-        normalized_outputs = [normalize_response(o) for o in outputs]
-        freq = Counter(normalized_outputs)
-        most_common, count = freq.most_common(1)[0]
-        if count >= 3:
-            print(f"✅ Majority response found on attempt {attempt+1} with count {count}")
-            majority_response = outputs[normalized_outputs.index(most_common)]
+        if majority_response is not None:
+            print(f"✅ Majority response found on attempt {attempt+1} after {len(outputs)} of {samples} samples")
+            notify(on_event, "majority", attempt=attempt + 1, samples=len(outputs))
+            branch = verification_branch(outputs, samples)
+            stats["verification"] = branch
+            started = time.perf_counter()
+            usage = {}
+            if branch.startswith("skipped"):
+                print(f"⏭️ Skipping teacher verification ({branch.replace('_', ' ')})")
+                record_verification(branch, started, usage)
+                audit_log.record("verification", request_id, attempt=attempt + 1, branch=branch,
+                                 answer=majority_response, seconds=0.0, tokens=usage)
+                notify(on_event, "token", text=majority_response)
+                return majority_response
             print("🔍 Triggering teacher for double-check of majority response...")
-            teacher_answer = verify_interactive_outputs(query, context_text, source_info, outputs)
-            normalized_teacher = normalize_response(teacher_answer)
-            teacher_filename = os.path.join(AGREED_JSON_DIR, f"teacher_verified_attempt_{attempt+1}.json")
-            if normalized_teacher:
-                with open(teacher_filename, "w") as f:
-                    f.write(teacher_answer)
-                print(f"✅ Teacher verified interactive response saved to {teacher_filename}")
-                return teacher_answer
-            else:
+            try:
+                if branch == "diff":
+                    teacher_answer = verify_answer_diff(query, context_text, outputs, on_token, usage)
+                else:
+                    teacher_answer = verify_interactive_outputs(query, context_text, source_info, outputs, on_token, usage)
+            except LLMError as e:
+                print(f"⚠️ Teacher verification failed: {str(e)}")
+                teacher_answer = ""
+            record_verification(branch, started, usage)
+            stats["llm_calls"] += 1
+            fallback = not normalize_response(teacher_answer)
+            if fallback:
                 print(f"⚠️ Teacher verification returned an invalid output on attempt {attempt+1}. Using majority response.")
-                teacher_filename = os.path.join(AGREED_JSON_DIR, f"teacher_verified_attempt_{attempt+1}_fallback.json")
-                with open(teacher_filename, "w") as f:
-                    f.write(majority_response)
-                return majority_response
+                # Whatever the teacher streamed before failing is discarded in favour of the majority answer
+                notify(on_event, "reset")
+                notify(on_event, "token", text=majority_response)
+            answer = majority_response if fallback else teacher_answer
+            audit_log.record(
+                "verification", request_id, attempt=attempt + 1, branch=branch, answer=answer, fallback=fallback,
+                seconds=round(time.perf_counter() - started, 3), tokens=usage
+            )
+            return answer
         else:
             print(f"⚠️ No majority found on attempt {attempt+1}.")
+            notify(on_event, "no_majority", attempt=attempt + 1, samples=len(outputs))
     
     # After all attempts, if no majority was reached in any attempt:
+    if not all_attempts_outputs:
+        raise LLMError(f"Every LLM sample failed across {max_attempts} attempts")
     print("🔍 No majority reached in any attempt. Invoking teacher with all aggregated outputs...")
-    teacher_answer = verify_interactive_outputs(query, context_text, source_info, all_attempts_outputs)
-    normalized_teacher = normalize_response(teacher_answer)
-    teacher_filename = os.path.join(AGREED_JSON_DIR, "teacher_verified_final.json")
-    if normalized_teacher:
-        with open(teacher_filename, "w") as f:
-            f.write(teacher_answer)
-        print(f"✅ Teacher verified interactive response saved to {teacher_filename}")
+    stats["verification"] = "final_teacher"
+    started = time.perf_counter()
+    usage = {}
+    teacher_answer = verify_interactive_outputs(query, context_text, source_info, all_attempts_outputs, on_token, usage)
+    record_verification("final_teacher", started, usage)
+    stats["llm_calls"] += 1
+    audit_log.record(
+        "verification", request_id, attempt=max_attempts, branch="final_teacher", answer=teacher_answer,
+        seconds=round(time.perf_counter() - started, 3), tokens=usage
+    )
+    if normalize_response(teacher_answer):
         return teacher_answer
     else:
         error_message = f"Error: Failed to get a consistent interactive response after {max_attempts} attempts."
@@ -244,6 +892,88 @@ def parallel_interactive_query(prompt: str, query: str, context_text: str, sourc
         return error_message
 
 
+# -----------------------
+# ANSWER POLICY (how many samples a question is worth)
+# -----------------------
+# fast: one call. vote-n: sample `samples` answers and require `quorum` to agree, then verify.
+# adaptive: one cheap agreement check first, escalating to vote-n only if it fails.
+ANSWER_POLICIES = ("fast", "vote-n", "adaptive")
+DEFAULT_ANSWER_POLICY = os.getenv("ANSWER_POLICY", "vote-n")
+# Upper bound on `samples`, which callers can set per request; every sample is an LLM call on the shared executor
+MAX_VOTE_SAMPLES = int(os.getenv("MAX_VOTE_SAMPLES", "9"))
+
+def make_answer_policy(mode: str = None, samples: int = None, quorum: int = None) -> dict:
+    mode = mode or DEFAULT_ANSWER_POLICY
+    if mode not in ANSWER_POLICIES:
+        raise ValueError(f"Unknown answer mode '{mode}'. Expected one of: {', '.join(ANSWER_POLICIES)}")
+    samples = samples or VOTE_SAMPLES
+    quorum = quorum or samples // 2 + 1
+    if samples < 1 or not 1 <= quorum <= samples:
+        raise ValueError(f"Invalid voting settings: samples={samples}, quorum={quorum}")
+    if samples > MAX_VOTE_SAMPLES:
+        raise ValueError(f"samples={samples} exceeds the maximum of {MAX_VOTE_SAMPLES}")
+    return {"mode": mode, "samples": samples, "quorum": quorum}
+
+def policy_key(policy: dict) -> str:
+    return f"{policy['mode']}:{policy['samples']}:{policy['quorum']}"
+
+def adaptive_check(prompt: str, checks: int):
+    """
+    Sample the adaptive policy's `checks` answers. Timed as its own `adaptive_check` stage and kept
+    out of the voting round metrics and `vote` events, since it is not a voting round.
+    Returns (outputs, calls_used).
+    """
+    with span("adaptive_check", samples=checks) as attributes:
+        outputs, _, calls_used = _collect_votes(prompt, checks, checks, None, None)
+        attributes.update(received=len(outputs), calls_used=calls_used)
+    return outputs, calls_used
+
+def answer_with_policy(prompt: str, query: str, context_text: str, source_info: str, policy: dict = None,
+                       stats: dict = None, on_event=None, validator=None) -> str:
+    """
+    Answer `prompt` under `policy`. In adaptive mode, `validator(output) -> bool` (e.g. a JSON
+    schema check) vets a single sample; without one, two samples must agree.
+    Records the mode used, whether it escalated, and the LLM call count in `stats`.
+    """
+    if policy is None:
+        policy = make_answer_policy()
+    if stats is None:
+        stats = {}
+    stats["mode"] = policy["mode"]
+    stats["llm_calls"] = 0
+
+    if policy["mode"] == "fast":
+        stats["llm_calls"] = 1
+        if on_event is None:
+            return query_openai(prompt, purpose="fast")
+        tokens = []
+        for token in stream_openai(prompt, purpose="fast"):
+            tokens.append(token)
+            notify(on_event, "token", text=token)
+        return "".join(tokens)
+
+    seed_outputs = []
+    if policy["mode"] == "adaptive":
+        checks = 1 if validator else 2
+        notify(on_event, "attempt", attempt=0, check=checks)
+        outputs, calls_used = adaptive_check(prompt, checks)
+        stats["llm_calls"] += calls_used
+        if len(outputs) == checks:
+            agreed = validator(outputs[0]) if validator else len({normalize_response(o) for o in outputs}) == 1
+            if agreed:
+                stats["escalated"] = False
+                notify(on_event, "token", text=outputs[0])
+                return outputs[0]
+        print("↗️ Adaptive check failed, escalating to voting")
+        stats["escalated"] = True
+        # The check samples are answers to the same prompt, so they are the vote's first ballots
+        seed_outputs = outputs
+
+    return parallel_interactive_query(
+        prompt, query, context_text, source_info, stats=stats, on_event=on_event,
+        samples=policy["samples"], quorum=policy["quorum"], seed_outputs=seed_outputs
+    )
+
 # -----------------------
 # PROMPT GENERATION FUNCTIONS (USA & Canada specific)
 # -----------------------
@@ -305,9 +1035,56 @@ Provide detailed, authoritative advice using evidence from the documents.
 # -----------------------
 # HELPER: Build Context from Similar Documents
 # -----------------------
-def build_context(vectordb, query, k=5):
-    docs_and_scores = vectordb.similarity_search_with_score(query, k=k)
-    context_text = "\n\n---\n".join([doc.page_content for doc, _ in docs_and_scores])
+# hybrid: fuse vector and BM25 rankings with reciprocal rank fusion. vector: embeddings only.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "1"))
+# How deep each ranking is read before fusing
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+VECTOR_WEIGHT = float(os.getenv("VECTOR_WEIGHT", "1.0"))
+KEYWORD_WEIGHT = float(os.getenv("KEYWORD_WEIGHT", "1.0"))
+
+def retrieve(kb, query, k=RETRIEVAL_K, source=None, mode=None):
+    """
+    Top `k` (Document, score) pairs for `query`, optionally restricted to one `source` file.
+    In hybrid mode the score is the fused RRF score rather than a vector distance.
+    """
+    mode = mode or RETRIEVAL_MODE
+    with span("retrieval", tenant=kb.tenant, mode=mode, k=k) as attributes:
+        results = _retrieve(kb, query, k, source, mode)
+        attributes["chunks"] = len(results)
+    return results
+
+def _retrieve(kb, query, k, source, mode):
+    search_filter = {"source": source} if source else None
+    if mode != "hybrid":
+        return kb.vectordb.similarity_search_with_score(query, k=k, filter=search_filter)
+
+    vector_hits = kb.vectordb.similarity_search_with_score(query, k=max(k, RETRIEVAL_CANDIDATES), filter=search_filter)
+    keyword_hits = kb.keyword_index.search(query, k=max(k, RETRIEVAL_CANDIDATES), source=source)
+    docs = {chunk_key(doc): doc for doc, _ in vector_hits}
+
+    missing = [chunk_id for chunk_id, _ in keyword_hits if chunk_id not in docs]
+    if missing:
+        fetched = kb.vectordb.get(ids=missing, include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+            docs[chunk_id] = Document(page_content=text, metadata=metadata or {})
+
+    fused = reciprocal_rank_fusion(
+        [[chunk_key(doc) for doc, _ in vector_hits], [chunk_id for chunk_id, _ in keyword_hits]],
+        [VECTOR_WEIGHT, KEYWORD_WEIGHT],
+        rrf_k=RRF_K,
+    )
+    return [(docs[chunk_id], score) for chunk_id, score in fused if chunk_id in docs][:k]
+
+def build_context(kb, query, k=RETRIEVAL_K, source=None):
+    """Retrieve the top `k` chunks, optionally restricted to the file whose `source` metadata is `source`."""
+    return format_context(retrieve(kb, query, k=k, source=source))
+
+def format_context(docs_and_scores):
+    """Join the retrieved excerpts, minus duplicates, up to CONTEXT_TOKEN_BUDGET tokens."""
+    docs_and_scores, excerpts = fit_excerpts(docs_and_scores, text_of=lambda pair: pair[0].page_content)
+    context_text = "\n\n---\n".join(excerpts)
     sources = []
     for doc, _ in docs_and_scores:
         try:
@@ -335,12 +1112,103 @@ def build_context(vectordb, query, k=5):
 # -----------------------
 # KEY DETAILS EXTRACTION FUNCTION
 # -----------------------
-def extract_summary_points(vectordb):
-    print("\n🚀 Extracting key mortgage details for USA and Canada...")
+# Bump whenever generate_summary_prompt or the extraction query changes
+SUMMARY_PROMPT_VERSION = "summary-v1"
+SUMMARY_CACHE_FILE = "mortgage_summary_cache.json"
+
+# Last extracted summary per (tenant, answer policy), valid while the tenant's index generation is unchanged
+_summary_memo = {}
+_summary_locks = {}   # (tenant, answer policy) -> lock held while that summary is being extracted
+_summary_locks_guard = threading.Lock()
+
+def summary_lock(tenant, key):
+    with _summary_locks_guard:
+        return _summary_locks.setdefault((tenant, key), threading.Lock())
+
+SUMMARY_KEYS = ("interest_rate", "monthly_payment", "cash_to_close")
+
+def is_valid_summary(output: str) -> bool:
+    """Cheap schema check used by the adaptive policy: a JSON object with every summary key."""
+    try:
+        data = json.loads(normalize_response(output))
+    except Exception:
+        return False
+    return isinstance(data, dict) and all(key in data for key in SUMMARY_KEYS)
+
+def document_set_fingerprint(kb, policy):
+    """Hash of every indexed file's content hash, so any add, change or delete yields a new value."""
+    manifest = load_manifest(kb)
+    digest = hashlib.sha256(f"{SUMMARY_PROMPT_VERSION}|{policy_key(policy)}".encode())
+    for path in sorted(manifest):
+        digest.update(f"\n{path}|{manifest[path]['sha256']}".encode())
+    return digest.hexdigest()
+
+def load_cached_summary(kb, fingerprint):
+    if not os.path.exists(kb.summary_cache_path):
+        return None
+    try:
+        with open(kb.summary_cache_path) as f:
+            cached = json.load(f)
+    except Exception as e:
+        print(f"Error reading cached summary: {str(e)}")
+        return None
+    return cached["summary"] if cached.get("fingerprint") == fingerprint else None
+
+def extract_summary_points(kb, stats=None, use_cache=True, policy=None):
+    """
+    Key mortgage details for the tenant's indexed document set. Results are reused, from memory
+    or from the tenant's SUMMARY_CACHE_FILE, until the set of indexed documents changes.
+    """
+    if stats is None:
+        stats = {}
+    if policy is None:
+        policy = make_answer_policy()
+    key = (kb.tenant, policy_key(policy))
+
+    def memoized():
+        memo = _summary_memo.get(key)
+        if use_cache and memo and memo["generation"] == kb.generation:
+            stats["cache"] = "memory"
+            stats["llm_calls"] = 0
+            return memo["summary"]
+        return None
+
+    # Memory hits never wait behind an extraction in progress
+    summary = memoized()
+    if summary is not None:
+        return summary
+    # One extraction per tenant and policy at a time; other tenants and policies are not held up
+    with summary_lock(*key):
+        summary = memoized()
+        if summary is not None:
+            return summary
+        generation = kb.generation
+
+        fingerprint = document_set_fingerprint(kb, policy)
+        cached = load_cached_summary(kb, fingerprint) if use_cache else None
+        if cached is not None:
+            stats["cache"] = "disk"
+            stats["llm_calls"] = 0
+            result = cached
+        else:
+            stats["cache"] = "miss"
+            result = run_summary_extraction(kb, stats, policy=policy)
+            if "error" not in result:
+                save_summary_json({"fingerprint": fingerprint, "summary": result}, kb.summary_cache_path)
+
+        if "error" not in result:
+            _summary_memo[key] = {"generation": generation, "fingerprint": fingerprint, "summary": result}
+        return result
+
+def run_summary_extraction(kb, stats=None, source=None, policy=None):
+    target = os.path.basename(source) if source else "all documents"
+    print(f"\n🚀 Extracting key mortgage details for USA and Canada ({target})...")
     extraction_query = "interest rate monthly payment cash to close USA Canada"
-    context_text, source_info = build_context(vectordb, extraction_query, k=1)
+    context_text, source_info = build_context(kb, extraction_query, source=source)
     prompt = generate_summary_prompt(context_text, source_info)
-    response = parallel_interactive_query(prompt, extraction_query, context_text, source_info)
+    response = answer_with_policy(
+        prompt, extraction_query, context_text, source_info, policy=policy, stats=stats, validator=is_valid_summary
+    )
     try:
         result = json.loads(normalize_response(response))
         print("\n📋 Extracted Mortgage Details (JSON):")
@@ -351,35 +1219,217 @@ def extract_summary_points(vectordb):
         result = {"error": "Failed to parse JSON output", "raw": response}
     return result
 
+# -----------------------
+# PER-DOCUMENT EXTRACTION (side-by-side comparisons)
+# -----------------------
+DOCUMENT_EXTRACTION_CONCURRENCY = int(os.getenv("DOCUMENT_EXTRACTION_CONCURRENCY", "4"))
+
+# Per-tenant, per-file results keyed on (path, content hash), so unchanged documents are never re-extracted
+_document_summary_memo = {}
+
+def extract_document_summary(kb, path, sha256, stats, use_cache=True, policy=None):
+    memo = _document_summary_memo.setdefault(kb.tenant, {})
+    memo_key = (path, sha256, SUMMARY_PROMPT_VERSION, policy_key(policy))
+    if use_cache and memo_key in memo:
+        stats["cache"] = "memory"
+        stats["llm_calls"] = 0
+        return memo[memo_key]
+    stats["cache"] = "miss"
+    result = run_summary_extraction(kb, stats, source=path, policy=policy)
+    if "error" not in result:
+        memo[memo_key] = result
+    return result
+
+def extract_document_summaries(kb, stats=None, use_cache=True, max_workers=DOCUMENT_EXTRACTION_CONCURRENCY, policy=None):
+    """
+    Extract key details separately for every document in the tenant's index, with up to `max_workers`
+    documents in flight. Returns one result per document, sorted by filename.
+    """
+    if stats is None:
+        stats = {}
+    if policy is None:
+        policy = make_answer_policy()
+    manifest = load_manifest(kb)
+    live_files = {(path, entry["sha256"]) for path, entry in manifest.items()}
+    memo = _document_summary_memo.setdefault(kb.tenant, {})
+    for stale_key in [key for key in memo if key[:2] not in live_files]:
+        del memo[stale_key]
+
+    per_document_stats = {path: {} for path in manifest}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="extract") as executor:
+        futures = {
+            path: metrics.submit(
+                executor, extract_document_summary, kb, path, entry["sha256"], per_document_stats[path], use_cache, policy
+            )
+            for path, entry in manifest.items()
+            if entry.get("chunks")
+        }
+    documents = []
+    for path, future in futures.items():
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Error extracting details from {os.path.basename(path)}: {str(e)}")
+            result = {"error": str(e)}
+        documents.append({"filename": os.path.basename(path), **result})
+    stats["mode"] = policy["mode"]
+    stats["llm_calls"] = sum(s.get("llm_calls", 0) for s in per_document_stats.values())
+    stats["documents"] = len(documents)
+    return sorted(documents, key=lambda d: d["filename"])
+
 def save_summary_json(summary, filename="mortgage_summary.json"):
+    # Extractions for different policies may save concurrently; each replaces the file whole
+    tmp_path = f"{filename}.{threading.get_ident()}.tmp"
     try:
-        with open(filename, "w") as f:
+        with open(tmp_path, "w") as f:
             json.dump(summary, f, indent=2)
+        os.replace(tmp_path, filename)
         print(f"✅ Mortgage summary saved to {filename}")
     except Exception as e:
         print(f"Error saving JSON: {str(e)}")
 
+# -----------------------
+# ANSWER CACHE
+# -----------------------
+# Bump whenever generate_query_prompt changes so stale answers are never served
+QUERY_PROMPT_VERSION = "query-v1"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Cosine similarity above which a differently worded question reuses an answer; 0 disables that tier
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+def normalize_question(question: str) -> str:
+    return " ".join(re.sub(r"[^\w\s$%.]", " ", question.lower()).split()).rstrip(".")
+
+def chunk_key(doc):
+    # Indexes built before chunk IDs were stored fall back to the chunk text
+    return doc.metadata.get("chunk_id") or hashlib.sha1(doc.page_content.encode()).hexdigest()
+
+class AnswerCache:
+    """
+    LRU/TTL cache of final answers. Exact hits are keyed on the normalized question,
+    the retrieved chunk IDs and the prompt version; near-duplicate hits additionally
+    require the same retrieved chunks and a question embedding above the similarity threshold.
+    A tenant's entries are dropped when its index changes.
+    """
+    def __init__(self, max_entries: int, ttl: float, similarity_threshold: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def invalidate(self, tenant: str):
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry["tenant"] == tenant]
+            for key in stale:
+                del self._entries[key]
+            self._counters["invalidations"] += 1
+
+    def _live(self, entry, now):
+        return now - entry["created_at"] <= self.ttl
+
+    def get(self, key: str, context_key: str, question_vector=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._live(entry, now):
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry["answer"], "hit"
+            if entry is not None:
+                del self._entries[key]
+            if question_vector is not None and self.similarity_threshold > 0:
+                for other_key, other in reversed(self._entries.items()):
+                    if other["context_key"] != context_key or not self._live(other, now):
+                        continue
+                    if cosine_similarity(question_vector, other["question_vector"]) >= self.similarity_threshold:
+                        self._entries.move_to_end(other_key)
+                        self._counters["near_hits"] += 1
+                        return other["answer"], "near_hit"
+            self._counters["misses"] += 1
+            return None, "miss"
+
+    def put(self, key: str, tenant: str, context_key: str, answer: str, question_vector=None):
+        with self._lock:
+            self._entries[key] = {
+                "tenant": tenant,
+                "answer": answer,
+                "context_key": context_key,
+                "question_vector": question_vector,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["near_hits"] + self._counters["misses"]
+            hits = self._counters["hits"] + self._counters["near_hits"]
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            }
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+    return dot / norm if norm else 0.0
+
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+
 # -----------------------
 # INTERACTIVE QUERY FUNCTIONS
 # -----------------------
-def ask_mortgage_query(query, vectordb):
+def ask_mortgage_query(query, kb, stats=None, on_event=None, policy=None):
+    if stats is None:
+        stats = {}
+    if policy is None:
+        policy = make_answer_policy()
+    stats["mode"] = policy["mode"]
+    normalized_question = normalize_question(query)
     query = "Can you give me a concise answer to: " + query
-    context_text, source_info = build_context(vectordb, query, k=1)
+    docs_and_scores = retrieve(kb, query)
+    notify(on_event, "retrieval", chunks=len(docs_and_scores))
+    # Answers produced for other tenants or under other policies are never shared, even by the near-duplicate tier
+    context_key = kb.tenant + "|" + policy_key(policy) + "|" + "|".join(chunk_key(doc) for doc, _ in docs_and_scores)
+    cache_key = hashlib.sha256(
+        f"{QUERY_PROMPT_VERSION}\n{context_key}\n{normalized_question}".encode()
+    ).hexdigest()
+    question_vector = None
+    if answer_cache.similarity_threshold > 0:
+        question_vector = get_embeddings().embed_query(normalized_question)
+
+    cached, outcome = answer_cache.get(cache_key, context_key, question_vector)
+    stats["cache"] = outcome
+    if cached is not None:
+        stats["llm_calls"] = 0
+        notify(on_event, "token", text=cached)
+        return cached
+
+    context_text, source_info = format_context(docs_and_scores)
     prompt = generate_query_prompt(query, context_text, source_info)
-    return parallel_interactive_query(prompt, query, context_text, source_info)
+    answer = answer_with_policy(prompt, query, context_text, source_info, policy=policy, stats=stats, on_event=on_event)
+    if not answer.startswith("Error"):
+        answer_cache.put(cache_key, kb.tenant, context_key, answer, question_vector)
+    return answer
 
 # -----------------------
 # MAIN OPERATION FLOW
 # -----------------------
 if __name__ == "__main__":
     print("\n🔥 INITIALIZING MORTGAGE ANALYSIS SYSTEM (USA & Canada)...")
-    vectordb = create_vector_db()
+    kb = create_vector_db()
     
     # Optionally, force an update of the vector database:
-    # vectordb = update_vector_db()
+    # kb = update_vector_db()
     
     # Extract key details and save as JSON
-    summary_json = extract_summary_points(vectordb)
+    summary_json = extract_summary_points(kb)
     save_summary_json(summary_json)
     
     # Interactive chatbot mode with /expert option for follow-up queries
@@ -392,7 +1442,7 @@ if __name__ == "__main__":
                 break
             
             print("\n🚀 Processing your query...")
-            answer = ask_mortgage_query(user_query, vectordb)
+            answer = ask_mortgage_query(user_query, kb)
             print(f"\n🎖️ Response:\n{answer}")
         except KeyboardInterrupt:
             print("\n🚪 Goodbye! 👋")
@@ -2,4 +2,4 @@
 echo "Installing dependencies..."
 pip install -r requirements.txt
 echo "Starting server..."
-python main.py 
\ No newline at end of file
+python -m uvicorn main:app --host 0.0.0.0 --port 8000 --reload 
\ No newline at end of file
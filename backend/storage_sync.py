@@ -0,0 +1,252 @@
+"""
+Two-way sync between a local directory and a Supabase Storage prefix.
+
+Files are compared by content (MD5, which Supabase reports as the object's ETag) against
+the state recorded at the last sync, so a file is only transferred when it is new or
+changed on one side; a file that differs on both sides is reported as a conflict and never
+overwritten. Transfers run on a bounded worker pool and stream through disk in
+chunks: neither downloads nor uploads hold a whole document in memory.
+"""
+import os
+import json
+import hashlib
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "4"))
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+LIST_PAGE_SIZE = 1000
+SYNC_STATE_FILENAME = ".storage_sync.json"
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(TRANSFER_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_etag(etag):
+    """Supabase ETags are quoted MD5 hex digests for single-part uploads; anything else is opaque."""
+    return (etag or "").strip('"').lower()
+
+
+class StorageClient:
+    """Minimal streaming client for the Supabase Storage REST API, on one pooled HTTP session."""
+
+    def __init__(self, url: str, key: str, bucket: str, timeout: float = 60):
+        self.base_url = f"{url.rstrip('/')}/storage/v1"
+        self.bucket = bucket
+        self.http = httpx.Client(
+            headers={"Authorization": f"Bearer {key}", "apikey": key},
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=SYNC_WORKERS * 2),
+        )
+
+    def _object_url(self, path):
+        return f"{self.base_url}/object/{self.bucket}/{quote(path)}"
+
+    def list(self, prefix: str = ""):
+        """Every object (not folder) directly under `prefix`, following pagination."""
+        objects, offset = [], 0
+        while True:
+            response = self.http.post(
+                f"{self.base_url}/object/list/{self.bucket}",
+                json={"prefix": prefix, "limit": LIST_PAGE_SIZE, "offset": offset,
+                      "sortBy": {"column": "name", "order": "asc"}},
+            )
+            response.raise_for_status()
+            page = response.json()
+            objects.extend(item for item in page if item.get("id"))
+            if len(page) < LIST_PAGE_SIZE:
+                return objects
+            offset += LIST_PAGE_SIZE
+
+    def download(self, path: str, dest: str):
+        """Stream the object into `dest` (atomically, via a temporary file). Returns its MD5."""
+        tmp_path = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.part")
+        digest = hashlib.md5()
+        try:
+            with self.http.stream("GET", self._object_url(path)) as response:
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    for block in response.iter_bytes(TRANSFER_CHUNK_SIZE):
+                        digest.update(block)
+                        f.write(block)
+            os.replace(tmp_path, dest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return digest.hexdigest()
+
+    def upload(self, path: str, src: str, content_type: str = "application/pdf", upsert: bool = False):
+        """Stream the file at `src` to the object `path`."""
+        def chunks():
+            with open(src, "rb") as f:
+                for block in iter(lambda: f.read(TRANSFER_CHUNK_SIZE), b""):
+                    yield block
+
+        response = self.http.post(
+            self._object_url(path),
+            content=chunks(),
+            headers={
+                "Content-Type": content_type,
+                "Content-Length": str(os.path.getsize(src)),
+                "x-upsert": "true" if upsert else "false",
+            },
+        )
+        response.raise_for_status()
+
+    def close(self):
+        self.http.close()
+
+
+class DirectorySync:
+    """Syncs the `*{extension}` files of `local_dir` with the objects under `prefix`."""
+
+    def __init__(self, client: StorageClient, local_dir: str, prefix: str = "", extension: str = ".pdf",
+                 workers: int = SYNC_WORKERS):
+        self.client = client
+        self.local_dir = local_dir
+        self.prefix = prefix.strip("/")
+        self.extension = extension
+        self.workers = max(1, workers)
+        self.state_path = os.path.join(local_dir, SYNC_STATE_FILENAME)
+        self._state_lock = threading.Lock()
+
+    def remote_path(self, filename):
+        return f"{self.prefix}/{filename}" if self.prefix else filename
+
+    def load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def local_md5(self, filename, state):
+        """MD5 of the local file, reusing the recorded one while size and mtime are unchanged."""
+        stats = os.stat(os.path.join(self.local_dir, filename))
+        entry = state.get(filename) or {}
+        if entry.get("size") == stats.st_size and entry.get("mtime") == stats.st_mtime and entry.get("md5"):
+            return entry["md5"]
+        return file_md5(os.path.join(self.local_dir, filename))
+
+    def list_remote(self):
+        return {item["name"]: item for item in self.client.list(self.prefix)
+                if item["name"].lower().endswith(self.extension)}
+
+    def plan(self, state):
+        """
+        Decide, per file, what to do. Returns {"download": [(name, etag)], "upload": [(name, md5, upsert)],
+        "compare": [(name, md5, etag)], "conflict": [name], "unchanged": [name]}.
+        """
+        remote = self.list_remote()
+        local = {name for name in os.listdir(self.local_dir) if name.lower().endswith(self.extension)}
+        actions = {"download": [], "upload": [], "compare": [], "conflict": [], "unchanged": []}
+        for name in sorted(set(remote) | local):
+            remote_etag = normalize_etag((remote[name].get("metadata") or {}).get("eTag")) if name in remote else None
+            if name not in local:
+                actions["download"].append((name, remote_etag))
+                continue
+            md5 = self.local_md5(name, state)
+            if name not in remote:
+                actions["upload"].append((name, md5, False))
+                continue
+            recorded = state.get(name) or {}
+            remote_changed = recorded.get("etag") != remote_etag
+            local_changed = recorded.get("md5") != md5
+            if remote_etag == md5 or (recorded and not remote_changed and not local_changed):
+                actions["unchanged"].append(name)
+                self._record(state, name, md5, remote_etag)
+            elif not recorded:
+                # Never synced and the ETag is not comparable (e.g. a multipart "<md5>-N"): compare the bytes
+                actions["compare"].append((name, md5, remote_etag))
+            elif not remote_changed:
+                actions["upload"].append((name, md5, True))
+            elif not local_changed:
+                actions["download"].append((name, remote_etag))
+            else:
+                # Changed on both sides since the last sync: leave both copies for someone to resolve
+                actions["conflict"].append(name)
+        return actions
+
+    def _record(self, state, filename, md5, etag):
+        stats = os.stat(os.path.join(self.local_dir, filename))
+        with self._state_lock:
+            state[filename] = {"md5": md5, "etag": etag, "size": stats.st_size, "mtime": stats.st_mtime}
+
+    def _download(self, state, filename, etag):
+        md5 = self.client.download(self.remote_path(filename), os.path.join(self.local_dir, filename))
+        self._record(state, filename, md5, etag)
+        return "downloaded"
+
+    def _upload(self, state, filename, md5, upsert):
+        self.client.upload(self.remote_path(filename), os.path.join(self.local_dir, filename), upsert=upsert)
+        # The new object's ETag is read back from the listing once all uploads are done
+        self._record(state, filename, md5, None)
+        return "uploaded"
+
+    def _compare(self, state, filename, md5, etag):
+        """Fetch the remote copy aside and keep the local file either way; equal bytes count as synced."""
+        scratch = os.path.join(self.local_dir, f".{filename}.remote")
+        try:
+            remote_md5 = self.client.download(self.remote_path(filename), scratch)
+        finally:
+            if os.path.exists(scratch):
+                os.remove(scratch)
+        if remote_md5 != md5:
+            return "conflicts"
+        self._record(state, filename, md5, etag)
+        return "unchanged"
+
+    def run(self):
+        """
+        Sync both ways. Returns {"downloaded", "uploaded", "unchanged", "conflicts", "failed"} filename
+        lists; only `downloaded` files changed on local disk. A file that differs on both sides
+        (changed on both since the last sync, or never synced) is reported as a conflict and left alone.
+        """
+        os.makedirs(self.local_dir, exist_ok=True)
+        state = self.load_state()
+        actions = self.plan(state)
+        result = {"downloaded": [], "uploaded": [], "unchanged": actions["unchanged"],
+                  "conflicts": actions["conflict"], "failed": []}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="storage-sync") as executor:
+            futures = [(executor.submit(self._download, state, name, etag), name) for name, etag in actions["download"]]
+            futures += [(executor.submit(self._upload, state, name, md5, upsert), name)
+                        for name, md5, upsert in actions["upload"]]
+            futures += [(executor.submit(self._compare, state, name, md5, etag), name)
+                        for name, md5, etag in actions["compare"]]
+            for future, name in futures:
+                try:
+                    outcome = future.result()
+                    result[outcome].append(name)
+                    print(f"{outcome.capitalize()} {name}")
+                except Exception as e:
+                    print(f"Error syncing {name}: {str(e)}")
+                    result["failed"].append(name)
+        if result["uploaded"]:
+            try:
+                remote = self.list_remote()
+                for name in result["uploaded"]:
+                    if name in remote:
+                        state[name]["etag"] = normalize_etag((remote[name].get("metadata") or {}).get("eTag"))
+            except Exception as e:
+                # Without the new ETags the next run compares these files again rather than trusting them
+                print(f"Error reading uploaded ETags: {str(e)}")
+        # Forget files that no longer exist locally
+        for name in list(state):
+            if not os.path.exists(os.path.join(self.local_dir, name)):
+                state.pop(name, None)
+        self.save_state(state)
+        return result
@@ -0,0 +1,93 @@
+"""
+Load test: the health check must stay fast while heavy queries are running.
+
+The heavy work (retrieval, LLM calls) is replaced by stubs that block their thread, as the
+real work does; if an endpoint ran it on the event loop, `GET /` would wait behind it.
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+for module in ("fastapi", "httpx", "supabase", "chromadb", "langchain_chroma", "langchain_huggingface"):
+    pytest.importorskip(module)
+
+import httpx
+
+HEAVY_SECONDS = 1.0
+HEAVY_REQUESTS = 8
+HEALTH_PROBES = 20
+# Generous for a loaded CI machine, and still far below HEAVY_SECONDS
+MAX_HEALTH_SECONDS = 0.25
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    env = {
+        "SUPABASE_URL": "http://localhost",
+        "SUPABASE_KEY": "a.b.c",
+        "OPENAI_API_BASE": "http://localhost",
+        "OPENAI_API_KEY": "test",
+        "WARM_START": "false",
+    }
+    saved_env = {name: os.environ.get(name) for name in env}
+    saved_cwd = os.getcwd()
+    os.environ.update(env)
+    # main creates its data, index and log directories relative to the working directory
+    os.chdir(tmp_path_factory.mktemp("backend"))
+    try:
+        import main
+        yield main
+    finally:
+        os.chdir(saved_cwd)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@pytest.fixture
+def slow_pipeline(main, monkeypatch):
+    def ask_mortgage_query(question, kb, stats=None, policy=None):
+        time.sleep(HEAVY_SECONDS)
+        return "stub answer"
+
+    def extract_summary_points(kb, stats=None, use_cache=True, policy=None):
+        time.sleep(HEAVY_SECONDS)
+        return {"summary": "stub summary"}
+
+    monkeypatch.setattr(main, "with_knowledge_base", lambda tenant, fn, *args, **kwargs: fn(None, *args, **kwargs))
+    monkeypatch.setattr(main, "ask_mortgage_query", ask_mortgage_query)
+    monkeypatch.setattr(main, "extract_summary_points", extract_summary_points)
+
+
+async def probe_health(client):
+    latencies = []
+    for _ in range(HEALTH_PROBES):
+        started = time.perf_counter()
+        response = await client.get("/")
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        await asyncio.sleep(HEAVY_SECONDS / HEALTH_PROBES)
+    return latencies
+
+
+async def run_load(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+        heavy = [client.post("/ask-query/", json={"question": f"question {i}"}) for i in range(HEAVY_REQUESTS)]
+        heavy += [client.post("/analyze-mortgage/") for _ in range(HEAVY_REQUESTS)]
+        started = time.perf_counter()
+        *responses, latencies = await asyncio.gather(*heavy, probe_health(client))
+        return responses, latencies, time.perf_counter() - started
+
+
+def test_health_check_stays_fast_under_heavy_queries(main, slow_pipeline):
+    responses, latencies, elapsed = asyncio.run(run_load(main.app))
+
+    assert [response.status_code for response in responses] == [200] * (2 * HEAVY_REQUESTS)
+    # The heavy requests ran side by side rather than one after another
+    assert elapsed < HEAVY_SECONDS * HEAVY_REQUESTS
+    assert max(latencies) < MAX_HEALTH_SECONDS, f"GET / latencies under load: {latencies}"
@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from llm_client import LLMClient, LLMError
+
+
+def completion(content="stub answer"):
+    return {"choices": [{"message": {"content": content}}], "usage": {"prompt_tokens": 3, "completion_tokens": 2}}
+
+
+class StubLLM:
+    """Chat-completions endpoint answering from a script of (status, headers, body, delay) replies."""
+
+    def __init__(self):
+        self.script = []
+        self.arrivals = []
+        self.lock = threading.Lock()
+
+    def reply(self, status=200, headers=None, body=None, delay=0.0):
+        self.script.append((status, headers or {}, completion() if body is None else body, delay))
+
+    def next_reply(self):
+        with self.lock:
+            self.arrivals.append(time.monotonic())
+            return self.script.pop(0) if self.script else (200, {}, completion(), 0.0)
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status, headers, body, delay = stub.next_reply()
+            time.sleep(delay)
+            payload = json.dumps(body).encode()
+            try:
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except OSError:
+                pass   # the client gave up (timeout test)
+
+    return Handler
+
+
+@pytest.fixture
+def stub():
+    return StubLLM()
+
+
+@pytest.fixture
+def server(stub):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def make_client(server, **overrides):
+    settings = dict(api_type="openai", api_base=server, api_key="test", api_version="", deployment="stub",
+                    timeout=2, max_retries=2, requests_per_minute=6000)
+    settings.update(overrides)
+    return LLMClient(**settings)
+
+
+def test_429_waits_for_retry_after(stub, server):
+    stub.reply(429, {"Retry-After": "0.3"}, {"error": "throttled"})
+    client = make_client(server)
+
+    started = time.monotonic()
+    assert client.chat("hello") == "stub answer"
+
+    assert len(stub.arrivals) == 2
+    assert stub.arrivals[1] - stub.arrivals[0] >= 0.3
+    assert time.monotonic() - started >= 0.3
+
+
+def test_long_retry_after_fails_fast(stub, server):
+    stub.reply(429, {"Retry-After": "600"}, {"error": "throttled"})
+    client = make_client(server)
+
+    started = time.monotonic()
+    with pytest.raises(LLMError, match="retry after 600s"):
+        client.chat("hello")
+    assert len(stub.arrivals) == 1
+
+    # Nobody else is held back for ten minutes either
+    assert client.chat("again") == "stub answer"
+    assert time.monotonic() - started < 1
+
+
+def test_5xx_is_retried_until_success(stub, server):
+    stub.reply(500, body={"error": "boom"})
+    stub.reply(503, {"Retry-After": "0"}, {"error": "busy"})
+    usage = {}
+
+    assert make_client(server).chat("hello", usage=usage) == "stub answer"
+
+    assert len(stub.arrivals) == 3
+    assert usage == {"prompt_tokens": 3, "completion_tokens": 2}
+
+
+def test_non_retryable_4xx_fails_after_one_request(stub, server):
+    stub.reply(400, body={"error": "bad request"})
+
+    with pytest.raises(LLMError, match="HTTP 400"):
+        make_client(server).chat("hello")
+
+    assert len(stub.arrivals) == 1
+
+
+def test_timeout_is_retried_then_raised(stub, server):
+    for _ in range(2):
+        stub.reply(delay=1.0)
+    client = make_client(server, timeout=0.2, max_retries=1)
+
+    with pytest.raises(LLMError, match="Timeout"):
+        client.chat("hello")
+
+    assert len(stub.arrivals) == 2
+
+
+def test_no_backoff_after_the_last_attempt(stub, server):
+    stub.reply(503, {"Retry-After": "5"}, {"error": "busy"})
+    client = make_client(server, max_retries=0)
+
+    started = time.monotonic()
+    with pytest.raises(LLMError, match="HTTP 503"):
+        client.chat("hello")
+
+    assert time.monotonic() - started < 2
+
+
+def test_429_pauses_every_caller(stub, server):
+    stub.reply(429, {"Retry-After": "0.5"}, {"error": "throttled"})
+    client = make_client(server)
+    first = threading.Thread(target=client.chat, args=("first",))
+    first.start()
+    # Wait until the first caller has seen the 429 and paused the shared limiter
+    deadline = time.monotonic() + 5
+    while client.limiter.paused_until <= time.monotonic() < deadline:
+        time.sleep(0.01)
+    throttled_at = stub.arrivals[0]
+
+    # A second caller, on its own thread, waits out the same pause instead of hitting the server
+    assert client.chat("second") == "stub answer"
+    first.join(5)
+
+    assert len(stub.arrivals) == 3
+    assert min(stub.arrivals[1:]) - throttled_at >= 0.45
+
+
+def test_failed_samples_are_not_counted_as_votes(tmp_path, monkeypatch):
+    for module in ("langchain_chroma", "langchain_huggingface", "chromadb"):
+        pytest.importorskip(module)
+    # mortgage_analysis creates its audit log and index directories relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    import mortgage_analysis
+
+    replies = iter([LLMError("HTTP 500"), LLMError("HTTP 500"), "yes", "yes", "yes"])
+    lock = threading.Lock()
+
+    def query_openai(prompt, usage=None, purpose="vote"):
+        with lock:
+            reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(mortgage_analysis, "query_openai", query_openai)
+    outputs, majority, calls_used = mortgage_analysis.collect_votes("prompt", n=5, quorum=3)
+
+    assert outputs == ["yes", "yes", "yes"]
+    assert majority == "yes"
+    assert calls_used == 5
+
+    def unavailable(prompt, usage=None, purpose="vote"):
+        raise LLMError("HTTP 503")
+
+    monkeypatch.setattr(mortgage_analysis, "query_openai", unavailable)
+    # Each failed call is replaced while the quorum is reachable, but none of them is a vote
+    assert mortgage_analysis.collect_votes("prompt", n=5, quorum=3) == ([], None, 5)
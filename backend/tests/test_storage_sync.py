@@ -0,0 +1,158 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from storage_sync import DirectorySync, StorageClient
+
+BUCKET = "pdfs"
+
+
+class StubStorage:
+    """Just enough of the Supabase Storage API: list, download and upload of one bucket."""
+
+    def __init__(self, multipart_etags=False):
+        self.objects = {}
+        self.multipart_etags = multipart_etags
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def put(self, name, data):
+        with self.lock:
+            self.objects[name] = data
+
+    def etag(self, data):
+        md5 = hashlib.md5(data).hexdigest()
+        return f'"{md5}-2"' if self.multipart_etags else f'"{md5}"'
+
+    def count(self, method):
+        return sum(1 for request in self.requests if request == method)
+
+
+def make_handler(storage):
+    object_prefix = f"/storage/v1/object/{BUCKET}/"
+    list_path = f"/storage/v1/object/list/{BUCKET}"
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=b"", content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            storage.requests.append("GET")
+            data = storage.objects.get(unquote(self.path[len(object_prefix):]))
+            if data is None:
+                return self._send(404, b"{}")
+            self._send(200, data, "application/pdf")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path == list_path:
+                storage.requests.append("LIST")
+                request = json.loads(body)
+                page = [{"name": name, "id": name, "metadata": {"eTag": storage.etag(data)}}
+                        for name, data in sorted(storage.objects.items())]
+                page = page[request["offset"]:request["offset"] + request["limit"]]
+                return self._send(200, json.dumps(page).encode())
+            storage.requests.append("POST")
+            storage.put(unquote(self.path[len(object_prefix):]), body)
+            self._send(200, b"{}")
+
+    return Handler
+
+
+@pytest.fixture
+def storage():
+    return StubStorage(multipart_etags=True)
+
+
+@pytest.fixture
+def client(storage):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(storage))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = StorageClient(f"http://127.0.0.1:{server.server_address[1]}", "key", BUCKET)
+    yield client
+    client.close()
+    server.shutdown()
+
+
+def test_opaque_etags_stay_unchanged_across_syncs(storage, client, tmp_path):
+    (tmp_path / "local.pdf").write_bytes(b"local document")
+    storage.put("remote.pdf", b"remote document")
+    sync = DirectorySync(client, str(tmp_path))
+
+    first = sync.run()
+    assert first["uploaded"] == ["local.pdf"]
+    assert first["downloaded"] == ["remote.pdf"]
+    assert (tmp_path / "remote.pdf").read_bytes() == b"remote document"
+
+    storage.requests.clear()
+    second = sync.run()
+    assert second["unchanged"] == ["local.pdf", "remote.pdf"]
+    assert second["downloaded"] == second["uploaded"] == second["conflicts"] == []
+    assert storage.count("GET") == storage.count("POST") == 0
+
+
+def test_one_sided_changes_transfer_in_the_right_direction(storage, client, tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"a1")
+    storage.put("b.pdf", b"b1")
+    sync = DirectorySync(client, str(tmp_path))
+    sync.run()
+
+    (tmp_path / "a.pdf").write_bytes(b"a2 changed locally")
+    storage.put("b.pdf", b"b2 changed remotely")
+    result = sync.run()
+
+    assert result["uploaded"] == ["a.pdf"]
+    assert result["downloaded"] == ["b.pdf"]
+    assert storage.objects["a.pdf"] == b"a2 changed locally"
+    assert (tmp_path / "b.pdf").read_bytes() == b"b2 changed remotely"
+    assert sync.run()["unchanged"] == ["a.pdf", "b.pdf"]
+
+
+def test_first_sync_never_overwrites_a_differing_local_file(storage, client, tmp_path):
+    (tmp_path / "same.pdf").write_bytes(b"identical")
+    (tmp_path / "differs.pdf").write_bytes(b"local version")
+    storage.put("same.pdf", b"identical")
+    storage.put("differs.pdf", b"remote version")
+    sync = DirectorySync(client, str(tmp_path))
+
+    result = sync.run()
+
+    assert result["conflicts"] == ["differs.pdf"]
+    assert result["unchanged"] == ["same.pdf"]
+    assert result["downloaded"] == result["uploaded"] == []
+    assert (tmp_path / "differs.pdf").read_bytes() == b"local version"
+    assert storage.objects["differs.pdf"] == b"remote version"
+    assert sorted(p.name for p in tmp_path.iterdir() if p.suffix != ".json") == ["differs.pdf", "same.pdf"]
+
+    # The identical file is now recorded as synced and is not fetched again
+    storage.requests.clear()
+    assert sync.run()["unchanged"] == ["same.pdf"]
+    assert storage.count("GET") == 1   # only the still-unresolved conflict is compared again
+
+
+def test_changes_on_both_sides_are_reported_as_conflicts(storage, client, tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"v1")
+    sync = DirectorySync(client, str(tmp_path))
+    sync.run()
+
+    (tmp_path / "a.pdf").write_bytes(b"v2 local")
+    storage.put("a.pdf", b"v2 remote")
+    result = sync.run()
+
+    assert result["conflicts"] == ["a.pdf"]
+    assert (tmp_path / "a.pdf").read_bytes() == b"v2 local"
+    assert storage.objects["a.pdf"] == b"v2 remote"
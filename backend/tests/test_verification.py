@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def mortgage_analysis(tmp_path, monkeypatch):
+    for module in ("httpx", "langchain_chroma", "langchain_huggingface", "chromadb"):
+        pytest.importorskip(module)
+    # mortgage_analysis creates its audit log and index directories relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    import mortgage_analysis
+
+    return mortgage_analysis
+
+
+def answering(*replies):
+    """A query_openai stand-in returning `replies` in order, one per call."""
+    replies = iter(replies)
+    lock = threading.Lock()
+
+    def query_openai(prompt, usage=None, purpose="vote"):
+        with lock:
+            return next(replies)
+
+    return query_openai
+
+
+def test_unanimous_vote_skips_teacher(mortgage_analysis, monkeypatch):
+    def teacher(*args, **kwargs):
+        raise AssertionError("the teacher should not be asked")
+
+    monkeypatch.setattr(mortgage_analysis, "VERIFY_POLICY", "skip-unanimous")
+    monkeypatch.setattr(mortgage_analysis, "VOTE_SAMPLING", "staged")
+    monkeypatch.setattr(mortgage_analysis, "query_openai", answering(*["yes"] * 5))
+    monkeypatch.setattr(mortgage_analysis, "ask_teacher", teacher)
+    stats = {}
+
+    answer = mortgage_analysis.parallel_interactive_query("prompt", "query", "context", "sources", stats=stats,
+                                                          samples=5, quorum=3)
+
+    assert answer == "yes"
+    assert stats["verification"] == "skipped_unanimous"
+    # The round went on past the 3-vote quorum, even with staged sampling, to see all five agree
+    assert stats["llm_calls"] == 5
+
+
+def test_split_vote_is_still_verified(mortgage_analysis, monkeypatch):
+    asked = []
+
+    def teacher(prompt, on_token=None, usage=None):
+        asked.append(prompt)
+        return "checked"
+
+    monkeypatch.setattr(mortgage_analysis, "VERIFY_POLICY", "skip-unanimous")
+    monkeypatch.setattr(mortgage_analysis, "query_openai", answering("yes", "yes", "yes", "yes", "no"))
+    monkeypatch.setattr(mortgage_analysis, "ask_teacher", teacher)
+    stats = {}
+
+    answer = mortgage_analysis.parallel_interactive_query("prompt", "query", "context", "sources", stats=stats,
+                                                          samples=5, quorum=3)
+
+    assert answer == "checked"
+    assert stats["verification"] == "teacher"
+    assert len(asked) == 1
+
+
+def test_failed_streamed_teacher_resets_to_majority(mortgage_analysis, monkeypatch):
+    def stream_openai(prompt, usage=None, purpose="teacher"):
+        yield "The rate is"
+        raise mortgage_analysis.LLMError("connection dropped")
+
+    monkeypatch.setattr(mortgage_analysis, "VERIFY_POLICY", "always")
+    monkeypatch.setattr(mortgage_analysis, "query_openai", answering(*["yes"] * 5))
+    monkeypatch.setattr(mortgage_analysis, "stream_openai", stream_openai)
+    events = []
+
+    answer = mortgage_analysis.parallel_interactive_query("prompt", "query", "context", "sources", samples=5,
+                                                          quorum=3, on_event=lambda event, data: events.append((event, data)))
+
+    assert answer == "yes"
+    streamed = [(event, data) for event, data in events if event in ("token", "reset")]
+    assert streamed == [("token", {"text": "The rate is"}), ("reset", {}), ("token", {"text": "yes"})]
+
+
+def test_adaptive_check_is_not_a_voting_round(mortgage_analysis, monkeypatch):
+    import metrics
+
+    monkeypatch.setattr(mortgage_analysis, "query_openai", answering("yes", "yes"))
+    rounds_before = metrics.vote_rounds.render()
+    agreement_before = metrics.vote_agreement.render()
+    events = []
+    stats = {}
+
+    answer = mortgage_analysis.answer_with_policy(
+        "prompt", "query", "context", "sources", mortgage_analysis.make_answer_policy("adaptive"), stats=stats,
+        on_event=lambda event, data: events.append(event)
+    )
+
+    assert answer == "yes"
+    assert stats["escalated"] is False
+    assert "vote" not in events
+    assert metrics.vote_rounds.render() == rounds_before
+    assert metrics.vote_agreement.render() == agreement_before
@@ -0,0 +1,108 @@
+"""
+Token counting and prompt budgeting.
+
+Counts use tiktoken when it is installed (and its encoding can be loaded), otherwise a
+chars/4 estimate. Context excerpts and sampled outputs are deduplicated and trimmed to a
+token budget before they go into a prompt, and every call's token usage is recorded per
+purpose so operators can see where the tokens go.
+"""
+import os
+import re
+import threading
+
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "o200k_base")  # gpt-4o family
+# Budgets for the variable parts of a prompt; the fixed instructions come on top
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+OUTPUTS_TOKEN_BUDGET = int(os.getenv("OUTPUTS_TOKEN_BUDGET", "2000"))
+# Prompts above this are logged as oversized
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "8000"))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+except Exception:
+    # Not installed, or the encoding file could not be fetched
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]) + " …"
+    return text[:max_tokens * 4] + " …"
+
+
+def _dedupe_key(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def fit_excerpts(items, budget: int = CONTEXT_TOKEN_BUDGET, text_of=lambda item: item):
+    """
+    Keep `items` (best first) whose text fits in `budget` tokens, dropping exact duplicates
+    (ignoring whitespace and case). The first excerpt that does not fit is truncated to fill
+    what is left. Returns (kept items, texts to use for them).
+    """
+    kept, texts, seen = [], [], set()
+    remaining = budget
+    for item in items:
+        text = text_of(item)
+        key = _dedupe_key(text)
+        if key in seen:
+            continue
+        seen.add(key)
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            # Not worth including a stub of a few tokens
+            if remaining >= 50:
+                kept.append(item)
+                texts.append(truncate_to_tokens(text, remaining))
+            break
+        kept.append(item)
+        texts.append(text)
+        remaining -= tokens
+    return kept, texts
+
+
+def fit_outputs(outputs, normalize, budget: int = OUTPUTS_TOKEN_BUDGET):
+    """
+    Collapse sampled outputs that normalize to the same answer and keep the most frequent
+    ones within `budget` tokens. Returns [(output, count)], most frequent first.
+    """
+    representatives, counts = {}, {}
+    for output in outputs:
+        normalized = normalize(output)
+        representatives.setdefault(normalized, output)
+        counts[normalized] = counts.get(normalized, 0) + 1
+    ranked = sorted(counts, key=counts.get, reverse=True)
+    kept, texts = fit_excerpts(ranked, budget, text_of=lambda normalized: representatives[normalized])
+    return [(text, counts[normalized]) for normalized, text in zip(kept, texts)]
+
+
+class TokenLedger:
+    """Running per-purpose totals of LLM calls and tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, purpose: str, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            entry = self._totals.setdefault(purpose, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {purpose: dict(entry) for purpose, entry in self._totals.items()}
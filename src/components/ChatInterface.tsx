@@ -1,5 +1,5 @@
 import React, { useState } from 'react';
-import { askMortgageQuestion } from '../services/mortgageAPI';
+import { streamMortgageQuestion } from '../services/mortgageAPI';
 
 export default function ChatInterface() {
   const [question, setQuestion] = useState('');
@@ -35,7 +35,8 @@ export default function ChatInterface() {
       setIsLoading(true);
       setError('');
       
-      const response = await askMortgageQuestion(questionToAsk);
+      setAnswer('');
+      const response = await streamMortgageQuestion(questionToAsk, setAnswer);
       setAnswer(response);
       setQuestion(''); // Clear the input field after submission
     } catch (err) {
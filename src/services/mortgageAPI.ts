@@ -29,4 +29,92 @@ export const askMortgageQuestion = async (question: string) => {
     console.error('Error asking mortgage question:', error);
     throw error;
   }
-}; 
\ No newline at end of file
+}; 
+/**
+ * Ask a mortgage question over the streaming endpoint
+ * @param question The user's mortgage-related question
+ * @param onToken Called with the answer text received so far, as it streams in
+ * @returns The final answer from the mortgage analysis system
+ */
+export const streamMortgageQuestion = async (
+  question: string,
+  onToken: (partialAnswer: string) => void
+): Promise<string> => {
+  const response = await fetch(`${API_BASE_URL}/ask-query/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ question }),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Error: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let partialAnswer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE messages are separated by a blank line
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const message = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      const event = message.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(message.match(/^data: (.*)$/m)?.[1] ?? '{}');
+      if (event === 'token') {
+        partialAnswer += data.text;
+        onToken(partialAnswer);
+      } else if (event === 'reset') {
+        // The answer so far was abandoned; it is streamed again from the start
+        partialAnswer = '';
+        onToken(partialAnswer);
+      } else if (event === 'done') {
+        return data.answer;
+      } else if (event === 'error') {
+        throw new Error(data.detail);
+      }
+    }
+  }
+
+  return partialAnswer;
+};
+
+export interface DocumentAnalysis {
+  filename: string;
+  interest_rate?: string;
+  monthly_payment?: string;
+  cash_to_close?: string;
+  error?: string;
+}
+
+/**
+ * Extract key mortgage details separately for every uploaded document
+ * @returns One analysis per document, sorted by filename
+ */
+export const analyzeMortgageDocuments = async (): Promise<DocumentAnalysis[]> => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/analyze-mortgage/?per_document=true`, {
+      method: 'POST',
+    });
+
+    if (!response.ok) {
+      throw new Error(`Error: ${response.status}`);
+    }
+
+    const data = await response.json();
+    return data.documents;
+  } catch (error) {
+    console.error('Error analyzing mortgage documents:', error);
+    throw error;
+  }
+};